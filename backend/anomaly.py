@@ -0,0 +1,171 @@
+import io
+
+import numpy
+from django.conf import settings
+from django.db import connection
+
+from backend.models import ProductInfo
+
+PRODUCT_INFO_TABLE = ProductInfo._meta.db_table
+
+# строка COPY ... WITH (FORMAT binary) из трех bigint: число полей и длина каждого поля
+CATALOG_ROW = numpy.dtype(
+    [
+        ("fields", ">i2"),
+        ("external_id_size", ">i4"),
+        ("external_id", ">i8"),
+        ("price_size", ">i4"),
+        ("price", ">i8"),
+        ("quantity_size", ">i4"),
+        ("quantity", ">i8"),
+    ]
+)
+# сигнатура, флаги и длина пустой области расширения заголовка
+COPY_HEADER_SIZE = 19
+COPY_TRAILER_SIZE = 2
+
+
+def load_catalog(shop_id):
+    """
+    Внешние ИД, цены и количества товаров магазина на продаже массивами NumPy.
+    На PostgreSQL данные читаются через бинарный COPY прямо в массив без
+    создания объектов Python для каждой строки
+    """
+
+    if connection.vendor == "postgresql":
+        buffer = io.BytesIO()
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                cursor.mogrify(
+                    f"""
+                    COPY (
+                        SELECT external_id::bigint, price::bigint, quantity::bigint
+                        FROM {PRODUCT_INFO_TABLE}
+                        WHERE shop_id = %s AND is_active
+                    ) TO STDOUT WITH (FORMAT binary)
+                    """,
+                    [shop_id],
+                ).decode(),
+                buffer,
+            )
+        size = len(buffer.getbuffer()) - COPY_HEADER_SIZE - COPY_TRAILER_SIZE
+        rows = numpy.frombuffer(
+            buffer.getbuffer(),
+            CATALOG_ROW,
+            count=size // CATALOG_ROW.itemsize,
+            offset=COPY_HEADER_SIZE,
+        )
+        return tuple(
+            rows[column].astype(numpy.int64)
+            for column in ("external_id", "price", "quantity")
+        )
+    rows = numpy.array(
+        ProductInfo.objects.filter(shop=shop_id, is_active=True).values_list(
+            "external_id", "price", "quantity"
+        ),
+        dtype=numpy.int64,
+    ).reshape(-1, 3)
+    return rows[:, 0], rows[:, 1], rows[:, 2]
+
+
+def goods_arrays(goods):
+    """
+    Внешние ИД, цены и количества пачки товаров массивами NumPy
+    """
+
+    return tuple(
+        numpy.fromiter((item[field] for item in goods), numpy.int64, len(goods))
+        for field in ("id", "price", "quantity")
+    )
+
+
+def find_anomalies(old, new, threshold):
+    """
+    Сравнить цены и количества нового списка (ids, prices, quantities) с текущими
+    за один векторный проход: подозрительны цены, изменившиеся более чем в
+    PRICELIST_ANOMALY_PRICE_FACTOR раз, обнулившиеся количества и выставленные
+    товары, которых нет в новом списке (пустой или обрезанный файл).
+    Загрузка задерживается, если доля подозрительных товаров среди уже
+    выставленных больше threshold магазина (None - проверка отключена)
+    """
+
+    old_ids, old_prices, old_quantities = old
+    new_ids, new_prices, new_quantities = new
+    report = {
+        "listed": len(old_ids),
+        "compared": 0,
+        "flagged": 0,
+        "price_jumps": 0,
+        "zeroed": 0,
+        "removed": 0,
+        "ratio": 0.0,
+        "held": False,
+        "samples": [],
+    }
+    if not len(old_ids):
+        return report
+    order = numpy.argsort(old_ids)
+    old_ids = old_ids[order]
+    position = numpy.searchsorted(old_ids, new_ids)
+    position[position == len(old_ids)] = 0
+    matched = old_ids[position] == new_ids
+    position = order[position[matched]]
+    old_prices, old_quantities = old_prices[position], old_quantities[position]
+    new_ids = new_ids[matched]
+    new_prices, new_quantities = new_prices[matched], new_quantities[matched]
+
+    factor = settings.PRICELIST_ANOMALY_PRICE_FACTOR
+    price_jumps = (old_prices > 0) & (
+        (new_prices >= old_prices * factor) | (new_prices * factor <= old_prices)
+    )
+    zeroed = (old_quantities > 0) & (new_quantities == 0)
+    anomalies = numpy.flatnonzero(price_jumps | zeroed)
+    compared = int(matched.sum())
+    removed = len(old_ids) - compared
+    flagged = len(anomalies) + removed
+    ratio = flagged / len(old_ids)
+    report.update(
+        compared=compared,
+        flagged=flagged,
+        price_jumps=int(price_jumps.sum()),
+        zeroed=int(zeroed.sum()),
+        removed=removed,
+        ratio=round(ratio, 4),
+        held=threshold is not None
+        and len(old_ids) >= settings.PRICELIST_ANOMALY_MIN_ITEMS
+        and ratio > threshold,
+        samples=[
+            {
+                "id": int(new_ids[index]),
+                "old_price": int(old_prices[index]),
+                "price": int(new_prices[index]),
+                "old_quantity": int(old_quantities[index]),
+                "quantity": int(new_quantities[index]),
+            }
+            for index in anomalies[: settings.PRICELIST_DIFF_SAMPLE_SIZE]
+        ],
+    )
+    return report
+
+
+def check_anomalies(shop, parts):
+    """
+    Сравнить новый список, собранный из частей goods_arrays, с каталогом магазина
+    """
+
+    new = tuple(numpy.concatenate(column) for column in zip(goods_arrays([]), *parts))
+    return find_anomalies(load_catalog(shop.id), new, shop.anomaly_threshold)
+
+
+def anomaly_errors(report):
+    """
+    Описание подозрительных изменений для ответа и письма магазину
+    """
+
+    return [
+        f"Подозрительные изменения у {report['flagged']} "
+        f"из {report['listed']} товаров ({report['ratio']:.0%}): "
+        f"цена изменилась в {settings.PRICELIST_ANOMALY_PRICE_FACTOR} и более раз "
+        f"у {report['price_jumps']}, количество обнулилось у {report['zeroed']}, "
+        f"нет в новом списке у {report['removed']}"
+    ]
@@ -0,0 +1,367 @@
+import json
+
+from backend.models import (Category, FacetCount, Product, ProductInfo,
+                            ProductParameter, StagedProductInfo)
+
+STAGED_TABLE = StagedProductInfo._meta.db_table
+PRODUCT_INFO_TABLE = ProductInfo._meta.db_table
+PRODUCT_PARAMETER_TABLE = ProductParameter._meta.db_table
+PRODUCT_TABLE = Product._meta.db_table
+CATEGORY_TABLE = Category._meta.db_table
+FACET_COUNT_TABLE = FacetCount._meta.db_table
+
+SEARCH_CONFIG = "russian"
+
+# веса поиска: название продукта > модель > категория > значения параметров
+SEARCH_VECTOR_SQL = f"""
+    UPDATE {PRODUCT_INFO_TABLE} product_info
+    SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', product.name), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', product_info.model), 'B')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(category.name, '')), 'C')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+            SELECT string_agg(product_parameter.value, ' ')
+            FROM {PRODUCT_PARAMETER_TABLE} product_parameter
+            WHERE product_parameter.product_info_id = product_info.id
+        ), '')), 'D')
+    FROM {PRODUCT_TABLE} product
+    LEFT JOIN {CATEGORY_TABLE} category ON category.id = product.category_id
+    WHERE product.id = product_info.product_id
+"""
+
+STAGED_COLUMNS = (
+    "job_id",
+    "product_info_id",
+    "external_id",
+    "product_id",
+    "model",
+    "quantity",
+    "price",
+    "price_rrc",
+    "parameters",
+)
+
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if type(value) == list:
+        value = json.dumps(value, ensure_ascii=False)
+    return str(value).translate(COPY_ESCAPES)
+
+
+class CopyStream:
+    """
+    Файлоподобный объект для copy_expert: строки формата text формируются
+    по мере чтения, поэтому данные не собираются в памяти целиком
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += "\t".join(_copy_value(value) for value in row) + "\n"
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    readline = read
+
+
+def create_temporary_staging(cursor):
+    """
+    Временная таблица с колонками StagedProductInfo, удаляется при завершении транзакции
+    """
+
+    cursor.execute("DROP TABLE IF EXISTS import_staged")
+    cursor.execute(
+        f"CREATE TEMP TABLE import_staged ON COMMIT DROP AS "
+        f"SELECT {', '.join(STAGED_COLUMNS)} FROM {STAGED_TABLE} WITH NO DATA"
+    )
+    return "import_staged"
+
+
+def copy_staged(cursor, table, job_id, staged):
+    """
+    Загрузить подготовленные строки в таблицу через COPY FROM STDIN
+    """
+
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(STAGED_COLUMNS)}) FROM STDIN",
+        CopyStream(
+            [job_id, *(getattr(row, column) for column in STAGED_COLUMNS[1:])]
+            for row in staged
+        ),
+    )
+
+
+def merge_staged(cursor, table, job_id, shop_id):
+    """
+    Применить подготовленные строки к ProductInfo и ProductParameter
+    несколькими set-based запросами
+    """
+
+    # свежезагруженная временная таблица без статистики приводит к nested loop
+    # при соединениях; общую таблицу обновляет analyze_staged до публикации
+    if table != STAGED_TABLE:
+        cursor.execute(f"ANALYZE {table}")
+    parameters = {"job": job_id, "shop": shop_id}
+    cursor.execute(
+        f"""
+        UPDATE {PRODUCT_INFO_TABLE} product_info
+        SET product_id = staged.product_id,
+            model = staged.model,
+            quantity = staged.quantity,
+            price = staged.price,
+            price_rrc = staged.price_rrc,
+            is_active = true
+        FROM {table} staged
+        WHERE staged.job_id = %(job)s AND product_info.id = staged.product_info_id
+        """,
+        parameters,
+    )
+    cursor.execute(
+        f"""
+        DELETE FROM {PRODUCT_PARAMETER_TABLE} product_parameter
+        USING {table} staged
+        WHERE staged.job_id = %(job)s
+            AND staged.parameters IS NOT NULL
+            AND product_parameter.product_info_id = staged.product_info_id
+        """,
+        parameters,
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO {PRODUCT_PARAMETER_TABLE} (product_info_id, parameter_id, value)
+        SELECT staged.product_info_id, (parameter ->> 0)::bigint, parameter ->> 1
+        FROM {table} staged
+        CROSS JOIN LATERAL jsonb_array_elements(staged.parameters) parameter
+        WHERE staged.job_id = %(job)s
+            AND staged.product_info_id IS NOT NULL
+            AND staged.parameters IS NOT NULL
+        """,
+        parameters,
+    )
+    cursor.execute(
+        f"""
+        WITH created AS (
+            INSERT INTO {PRODUCT_INFO_TABLE}
+                (model, external_id, product_id, shop_id,
+                 quantity, price, price_rrc, is_active)
+            SELECT model, external_id, product_id, %(shop)s,
+                quantity, price, price_rrc, true
+            FROM {table}
+            WHERE job_id = %(job)s AND product_info_id IS NULL
+            RETURNING id, external_id
+        )
+        INSERT INTO {PRODUCT_PARAMETER_TABLE} (product_info_id, parameter_id, value)
+        SELECT created.id, (parameter ->> 0)::bigint, parameter ->> 1
+        FROM created
+        JOIN {table} staged
+            ON staged.job_id = %(job)s
+            AND staged.product_info_id IS NULL
+            AND staged.external_id = created.external_id
+        CROSS JOIN LATERAL jsonb_array_elements(staged.parameters) parameter
+        """,
+        parameters,
+    )
+
+
+def analyze_staged(cursor):
+    """
+    Обновить статистику общей таблицы StagedProductInfo после загрузки частей.
+    Вызывается вне транзакции публикации: ANALYZE держит блокировку до конца
+    транзакции, а таблица, занятая автоочисткой или другим ANALYZE, пропускается
+    """
+
+    cursor.execute(f"ANALYZE (SKIP_LOCKED) {STAGED_TABLE}")
+
+
+# товары магазина, которых нет в загруженном списке (import_external_ids)
+MISSING_CONDITION = """
+    NOT EXISTS (
+        SELECT 1 FROM import_external_ids
+        WHERE import_external_ids.external_id = product_info.external_id
+    )
+"""
+
+# товары, у которых при публикации меняются параметры, продукт или is_active
+FACET_CHANGED_CONDITION = """
+    product_info.external_id IN (SELECT external_id FROM import_facet_external_ids)
+"""
+
+
+def load_external_ids(cursor, external_ids):
+    """
+    Загрузить внешние ИД списка во временную таблицу import_external_ids
+    """
+
+    cursor.execute("DROP TABLE IF EXISTS import_external_ids")
+    cursor.execute(
+        "CREATE TEMP TABLE import_external_ids (external_id bigint PRIMARY KEY) "
+        "ON COMMIT DROP"
+    )
+    cursor.copy_expert(
+        "COPY import_external_ids (external_id) FROM STDIN",
+        CopyStream([external_id] for external_id in external_ids),
+    )
+    cursor.execute("ANALYZE import_external_ids")
+
+
+def retire_missing(cursor, shop_id):
+    """
+    Снять с продажи товары магазина, внешних ИД которых нет в import_external_ids
+    """
+
+    cursor.execute(
+        f"""
+        UPDATE {PRODUCT_INFO_TABLE} product_info
+        SET is_active = false
+        WHERE product_info.shop_id = %s
+            AND product_info.is_active
+            AND {MISSING_CONDITION}
+        """,
+        [shop_id],
+    )
+
+
+def update_search_vectors(cursor, table, job_id, shop_id):
+    """
+    Пересчитать поисковые векторы новых и измененных товаров магазина
+    """
+
+    cursor.execute(
+        f"""
+        {SEARCH_VECTOR_SQL}
+            AND product_info.shop_id = %(shop)s
+            AND (
+                product_info.search_vector IS NULL
+                OR product_info.id IN (
+                    SELECT product_info_id FROM {table} WHERE job_id = %(job)s
+                )
+            )
+        """,
+        {"job": job_id, "shop": shop_id},
+    )
+
+
+def plan_facet_delta(cursor, table, job_id):
+    """
+    Подготовить изменения счетчиков FacetCount до применения подготовленных
+    строк: отобрать товары, у которых меняются параметры, продукт или is_active
+    (только цены и остатки на счетчики не влияют), и вычесть их текущий вклад
+    """
+
+    cursor.execute("DROP TABLE IF EXISTS import_facet_delta")
+    cursor.execute(
+        "CREATE TEMP TABLE import_facet_delta (category_id bigint, "
+        "parameter_id bigint, value varchar(100), delta integer) ON COMMIT DROP"
+    )
+    cursor.execute("DROP TABLE IF EXISTS import_facet_external_ids")
+    cursor.execute(
+        f"""
+        CREATE TEMP TABLE import_facet_external_ids ON COMMIT DROP AS
+        SELECT staged.external_id
+        FROM {table} staged
+        LEFT JOIN {PRODUCT_INFO_TABLE} product_info
+            ON product_info.id = staged.product_info_id
+        WHERE staged.job_id = %s
+            AND (
+                staged.parameters IS NOT NULL
+                OR product_info.id IS NULL
+                OR NOT product_info.is_active
+                OR product_info.product_id <> staged.product_id
+            )
+        """,
+        [job_id],
+    )
+
+
+def collect_facet_delta(cursor, shop_id, sign, condition):
+    """
+    Добавить к изменениям счетчиков вклад товаров магазина на продаже,
+    отобранных условием condition, со знаком sign
+    """
+
+    cursor.execute(
+        f"""
+        INSERT INTO import_facet_delta (category_id, parameter_id, value, delta)
+        SELECT product.category_id, product_parameter.parameter_id,
+            product_parameter.value, {int(sign)} * count(*)
+        FROM {PRODUCT_PARAMETER_TABLE} product_parameter
+        JOIN {PRODUCT_INFO_TABLE} product_info
+            ON product_info.id = product_parameter.product_info_id
+        JOIN {PRODUCT_TABLE} product ON product.id = product_info.product_id
+        WHERE product_info.shop_id = %s AND product_info.is_active AND {condition}
+        GROUP BY 1, 2, 3
+        """,
+        [shop_id],
+    )
+
+
+def apply_facet_delta(cursor, shop_id):
+    """
+    Применить накопленные изменения к счетчикам FacetCount магазина:
+    затрагиваются только значения параметров измененных товаров
+    """
+
+    cursor.execute("DROP TABLE IF EXISTS import_facet_total")
+    cursor.execute(
+        """
+        CREATE TEMP TABLE import_facet_total ON COMMIT DROP AS
+        SELECT category_id, parameter_id, value, sum(delta) AS delta
+        FROM import_facet_delta
+        GROUP BY 1, 2, 3
+        HAVING sum(delta) <> 0
+        """
+    )
+    parameters = {"shop": shop_id}
+    cursor.execute(
+        f"""
+        UPDATE {FACET_COUNT_TABLE} facet
+        SET count = greatest(facet.count + total.delta, 0)
+        FROM import_facet_total total
+        WHERE facet.shop_id = %(shop)s
+            AND facet.category_id = total.category_id
+            AND facet.parameter_id = total.parameter_id
+            AND facet.value = total.value
+        """,
+        parameters,
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO {FACET_COUNT_TABLE}
+            (shop_id, category_id, parameter_id, value, count)
+        SELECT %(shop)s, total.category_id, total.parameter_id, total.value, total.delta
+        FROM import_facet_total total
+        WHERE total.delta > 0
+            AND NOT EXISTS (
+                SELECT 1 FROM {FACET_COUNT_TABLE} facet
+                WHERE facet.shop_id = %(shop)s
+                    AND facet.category_id = total.category_id
+                    AND facet.parameter_id = total.parameter_id
+                    AND facet.value = total.value
+            )
+        """,
+        parameters,
+    )
+    cursor.execute(
+        f"""
+        DELETE FROM {FACET_COUNT_TABLE} facet
+        USING import_facet_total total
+        WHERE facet.shop_id = %(shop)s
+            AND facet.count = 0
+            AND facet.category_id = total.category_id
+            AND facet.parameter_id = total.parameter_id
+            AND facet.value = total.value
+        """,
+        parameters,
+    )
@@ -0,0 +1,162 @@
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramWordSimilarity)
+from django.db import connections
+from django.db.models import Exists, F, OuterRef, Sum
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from backend.copy_loader import SEARCH_CONFIG
+from backend.models import FacetCount, ProductParameter
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск товаров по search_vector (GIN-индекс) с сортировкой
+    по релевантности. На СУБД кроме PostgreSQL - обычный поиск по search_fields
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or connections[queryset.db].vendor != "postgresql":
+            return super().filter_queryset(request, queryset, view)
+        query = SearchQuery(
+            " ".join(terms), config=SEARCH_CONFIG, search_type="websearch"
+        )
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "id")
+        )
+
+
+class ProductFacetFilter(BaseFilterBackend):
+    """
+    Отбор товаров по категории (category=ИД) и значениям параметров
+    (parameter=название:значение, можно несколько). Значения одного параметра
+    объединяются через ИЛИ, разные параметры - через И
+    """
+
+    category_query_param = "category"
+    parameter_query_param = "parameter"
+
+    def get_parameters(self, request):
+        parameters = {}
+        for parameter in request.query_params.getlist(self.parameter_query_param):
+            name, separator, value = parameter.partition(":")
+            if separator and name.strip():
+                parameters.setdefault(name.strip(), []).append(value.strip())
+        return parameters
+
+    def filter_queryset(self, request, queryset, view):
+        category = request.query_params.get(self.category_query_param)
+        if category:
+            queryset = queryset.filter(
+                product__category=category if category.isdigit() else None
+            )
+        for name, values in self.get_parameters(request).items():
+            queryset = queryset.filter(
+                Exists(
+                    ProductParameter.objects.filter(
+                        product_info=OuterRef("pk"),
+                        parameter__name=name,
+                        value__in=values,
+                    )
+                )
+            )
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.category_query_param,
+                "required": False,
+                "in": "query",
+                "description": "ИД категории",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.parameter_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Значение параметра в виде название:значение, "
+                "можно указать несколько",
+                "schema": {"type": "array", "items": {"type": "string"}},
+                "explode": True,
+            },
+            {
+                "name": "facets",
+                "required": False,
+                "in": "query",
+                "description": "true - добавить в ответ число товаров на продаже "
+                "по значениям параметров: всего или в категории category, "
+                "фильтры parameter и search на счетчики не влияют",
+                "schema": {"type": "boolean"},
+            },
+        ]
+
+
+def facet_counts(category=None):
+    """
+    Число товаров на продаже по значениям параметров (всего или в категории)
+    из счетчиков FacetCount, обновляемых при загрузке списков товаров.
+    Фильтры parameter и search счетчики не учитывают
+    """
+
+    # счетчики ведутся по категориям, общий вывод суммирует их
+    counts = FacetCount.objects.all()
+    if category:
+        counts = (
+            counts.filter(category=category) if category.isdigit() else counts.none()
+        )
+    facets = {}
+    for row in (
+        counts.values("parameter__name", "value")
+        .annotate(total=Sum("count"))
+        .order_by("parameter__name", "-total", "value")
+    ):
+        facets.setdefault(row["parameter__name"], []).append(
+            {"value": row["value"], "count": row["total"]}
+        )
+    return [
+        {"parameter": parameter, "values": values}
+        for parameter, values in facets.items()
+    ]
+
+
+@lru_cache
+def trigram_available(alias):
+    """
+    Установлено ли расширение pg_trgm в базе alias
+    """
+
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def suggest_names(queryset, text, limit, fields=("id", "name")):
+    """
+    Подсказки по полю name, лучшие совпадения первыми. С pg_trgm - по похожести
+    триграмм на слова названия (триграммный GIN-индекс, устойчиво к опечаткам),
+    без него - по вхождению подстроки с оценкой похожести difflib
+    """
+
+    if trigram_available(queryset.db):
+        return list(
+            queryset.filter(name__trigram_word_similar=text)
+            .annotate(similarity=TrigramWordSimilarity(text, "name"))
+            .order_by("-similarity", "name")
+            .values(*fields, "similarity")[:limit]
+        )
+    rows = list(queryset.filter(name__icontains=text).values(*fields)[: limit * 5])
+    for row in rows:
+        row["similarity"] = SequenceMatcher(
+            None, text.lower(), row["name"].lower()
+        ).ratio()
+    rows.sort(key=lambda row: (-row["similarity"], row["name"]))
+    return rows[:limit]
@@ -1,76 +1,1017 @@
-from django.db import IntegrityError
+import json
+import threading
+import time
+from collections import Counter
+from queue import Empty, Full, Queue
 
-from backend.models import (Category, Parameter, Product, ProductInfo,
-                            ProductParameter, Shop)
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
 
+from backend import copy_loader
+from backend.anomaly import anomaly_errors, check_anomalies, goods_arrays
+from backend.models import (Category, FacetCount, ImportCheckpoint, ImportJob,
+                            Parameter, Product, ProductInfo, ProductParameter,
+                            Shop, StagedProductInfo)
+from backend.parsers import PRICELIST_SECTIONS, PricelistFormatError
+from backend.storage import delete_blob, save_payload
 
-def import_pricelist(data, shop_id):
-    shop = Shop.objects.get(id=shop_id)
-    for category in data["categories"]:
+
+def _chunked(iterable, size):
+    """
+    Разбить последовательность на списки длиной не более size
+    """
+
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _check_category_names(names):
+    """
+    Проверить, что существующие категории {id: name} называются так же.
+    Возвращает найденные категории
+    """
+
+    existing = Category.objects.in_bulk(list(names))
+    for category_id, category_object in existing.items():
+        if category_object.name != names[category_id]:
+            raise IntegrityError(
+                f"Категория с ИД {category_id} уже существует под названием '{category_object.name}'"
+            )
+    return existing
+
+
+def _resolve_categories(shop, categories):
+    """
+    Создать недостающие категории одним запросом и привязать их к магазину.
+    Категории, созданные параллельной загрузкой другого магазина, пропускаются
+    """
+
+    names = {category["id"]: category["name"] for category in categories}
+    existing = _check_category_names(names)
+    missing = {
+        category_id: name
+        for category_id, name in names.items()
+        if category_id not in existing
+    }
+    Category.objects.bulk_create(
+        [
+            Category(id=category_id, name=name)
+            for category_id, name in sorted(missing.items())
+        ],
+        ignore_conflicts=True,
+    )
+    # параллельная загрузка могла создать те же ИД под другими названиями
+    _check_category_names(missing)
+    shop.categories.add(*names)
+
+
+def _read_products(keys, products):
+    """
+    Дополнить кэш products ИД существующих продуктов с ключами keys
+    """
+
+    for product_id, name, category_id in Product.objects.filter(
+        name__in={name for name, _ in keys},
+        category_id__in={category_id for _, category_id in keys},
+    ).values_list("id", "name", "category_id"):
+        if (name, category_id) in keys:
+            products[(name, category_id)] = product_id
+
+
+def _resolve_products(goods, products, create=True):
+    """
+    Найти или создать продукты пачкой, дополнив кэш products {(name, category): id}.
+    При create=False недостающие продукты не создаются и получают ИД None
+    """
+
+    keys = {(item["name"], item["category"]) for item in goods} - products.keys()
+    if not keys:
+        return
+    _read_products(keys, products)
+    missing = sorted(key for key in keys if key not in products)
+    if not create:
+        products.update(dict.fromkeys(missing))
+        return
+    if missing:
+        # продукты, созданные параллельной загрузкой, пропускаются и перечитываются
+        Product.objects.bulk_create(
+            [
+                Product(name=name, category_id=category_id)
+                for name, category_id in missing
+            ],
+            ignore_conflicts=True,
+        )
+        _read_products(set(missing), products)
+
+
+def _resolve_parameters(goods, parameters, create=True):
+    """
+    Найти или создать имена параметров пачкой, дополнив кэш parameters {name: id}.
+    При create=False недостающие имена не создаются и получают ИД None
+    """
+
+    names = {name for item in goods for name in item["parameters"]} - parameters.keys()
+    if not names:
+        return
+    parameters.update(
+        Parameter.objects.filter(name__in=names).values_list("name", "id")
+    )
+    missing = sorted(name for name in names if name not in parameters)
+    if not create:
+        parameters.update(dict.fromkeys(missing))
+        return
+    if missing:
+        # имена, созданные параллельной загрузкой, пропускаются и перечитываются
+        Parameter.objects.bulk_create(
+            [Parameter(name=name) for name in missing], ignore_conflicts=True
+        )
+        parameters.update(
+            Parameter.objects.filter(name__in=missing).values_list("name", "id")
+        )
+
+
+PRODUCT_INFO_FIELDS = ("product_id", "model", "price", "price_rrc", "quantity")
+
+
+def _plan_goods(shop, goods, products, parameters, create=True):
+    """
+    Сравнить пачку товаров с текущими записями магазина по external_id.
+    Живые таблицы не меняются: возвращаются несохраненные StagedProductInfo
+    только для новых и изменившихся товаров.
+    При create=False недостающие продукты и имена параметров не создаются
+    """
+
+    _resolve_products(goods, products, create)
+    _resolve_parameters(goods, parameters, create)
+    incoming = {
+        item["id"]: StagedProductInfo(
+            product_id=products[(item["name"], item["category"])],
+            external_id=item["id"],
+            model=item["model"],
+            price=item["price"],
+            price_rrc=item["price_rrc"],
+            quantity=item["quantity"],
+            parameters=[
+                [parameters[name], str(value)]
+                for name, value in item["parameters"].items()
+            ],
+        )
+        for item in goods
+    }
+    existing = {
+        product_info.external_id: product_info
+        for product_info in ProductInfo.objects.filter(
+            shop=shop, external_id__in=list(incoming)
+        ).only("id", "external_id", "is_active", *PRODUCT_INFO_FIELDS)
+    }
+    current_parameters = {}
+    for product_info_id, parameter_id, value in ProductParameter.objects.filter(
+        product_info__in=[product_info.id for product_info in existing.values()]
+    ).values_list("product_info_id", "parameter_id", "value"):
+        current_parameters.setdefault(product_info_id, {})[parameter_id] = value
+
+    staged = []
+    for external_id, row in incoming.items():
+        old = existing.get(external_id)
+        if old is None:
+            staged.append(row)
+            continue
+        row.product_info_id = old.id
+        if dict(row.parameters) == current_parameters.get(old.id, {}):
+            row.parameters = None
         if (
-            "id" in category.keys()
-            and category["id"]
-            and type(category["id"]) == int
-            and "name" in category.keys()
-            and category["name"]
+            row.parameters is not None
+            or not old.is_active
+            or any(
+                getattr(old, field) != getattr(row, field)
+                for field in PRODUCT_INFO_FIELDS
+            )
         ):
-            try:
-                category_object = Category.objects.get_or_create(
-                    id=category["id"],
-                    name=category["name"],
-                )[0]
-                category_object.shop.add(shop.id)
-                category_object.save()
-            except IntegrityError as error:
-                return {"Errors": str(error)}
-            else:
-                ProductInfo.objects.filter(shop=shop.id).delete()
-                for item in data["goods"]:
-                    if type(item) == dict and "name" in item.keys() and item["name"]:
-                        try:
-                            product = Product.objects.get_or_create(
-                                name=item["name"],
-                                category=Category.objects.get(id=item["category"]),
-                            )[0]
-                            product_info = ProductInfo.objects.create(
-                                product=product,
-                                external_id=item["id"],
-                                model=item["model"],
-                                price=item["price"],
-                                price_rrc=item["price_rrc"],
-                                quantity=item["quantity"],
-                                shop=shop,
-                            )
-                        except IntegrityError as error:
-                            return {"Errors": str(error)}
-                        else:
-                            for name, value in item["parameters"].items():
-                                if name and value:
-                                    try:
-                                        parameter_object = (
-                                            Parameter.objects.get_or_create(name=name)[
-                                                0
-                                            ]
-                                        )
-                                        ProductParameter.objects.create(
-                                            product_info=product_info,
-                                            parameter=parameter_object,
-                                            value=value,
-                                        )
-                                    except IntegrityError as error:
-                                        return {"Errors": str(error)}
-                                    else:
-                                        continue
-                                else:
-                                    return {
-                                        "Error": "Ошибка при обработки значений 'parameters'. Не указаны даннные - (name and value)"
-                                    }
+            staged.append(row)
+    return staged
+
+
+def _publish(shop, staged, external_ids, batch_size, job_id=None):
+    """
+    Применить подготовленные изменения к каталогу магазина одной транзакцией:
+    до ее завершения покупатели видят прежний список товаров.
+    Счетчики значений параметров меняются только на вклад товаров,
+    у которых изменились параметры, продукт или is_active.
+    Если job_id указан, на PostgreSQL изменения берутся прямо из таблицы
+    StagedProductInfo, иначе staged загружаются во временную таблицу через COPY
+    """
+
+    with transaction.atomic():
+        # публикации одного магазина выполняются по очереди
+        Shop.objects.select_for_update().filter(id=shop.id).exists()
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                if job_id is None:
+                    table, job_id = copy_loader.create_temporary_staging(cursor), 0
+                    copy_loader.copy_staged(cursor, table, job_id, staged)
+                else:
+                    table = copy_loader.STAGED_TABLE
+                facet_changed = copy_loader.FACET_CHANGED_CONDITION
+                copy_loader.plan_facet_delta(cursor, table, job_id)
+                copy_loader.collect_facet_delta(cursor, shop.id, -1, facet_changed)
+                copy_loader.merge_staged(cursor, table, job_id, shop.id)
+                copy_loader.collect_facet_delta(cursor, shop.id, 1, facet_changed)
+                copy_loader.update_search_vectors(cursor, table, job_id, shop.id)
+                copy_loader.load_external_ids(cursor, external_ids)
+                copy_loader.collect_facet_delta(
+                    cursor, shop.id, -1, copy_loader.MISSING_CONDITION
+                )
+                copy_loader.retire_missing(cursor, shop.id)
+                copy_loader.apply_facet_delta(cursor, shop.id)
+            return
+        facet_delta = Counter()
+        for batch in _chunked(staged, batch_size):
+            created = [row for row in batch if row.product_info_id is None]
+            changed = [row for row in batch if row.product_info_id is not None]
+            # только цены и остатки на счетчики значений параметров не влияют
+            active = dict(
+                ProductInfo.objects.filter(
+                    id__in=[row.product_info_id for row in changed], is_active=True
+                ).values_list("id", "product_id")
+            )
+            affected = [
+                row.product_info_id
+                for row in changed
+                if row.parameters is not None
+                or active.get(row.product_info_id) != row.product_id
+            ]
+            facet_delta.subtract(_facet_counts(affected))
+            product_infos = ProductInfo.objects.bulk_create(
+                [
+                    ProductInfo(
+                        shop=shop,
+                        external_id=row.external_id,
+                        **{field: getattr(row, field) for field in PRODUCT_INFO_FIELDS},
+                    )
+                    for row in created
+                ]
+            )
+            ProductInfo.objects.bulk_update(
+                [
+                    ProductInfo(
+                        id=row.product_info_id,
+                        is_active=True,
+                        **{field: getattr(row, field) for field in PRODUCT_INFO_FIELDS},
+                    )
+                    for row in changed
+                ],
+                [*PRODUCT_INFO_FIELDS, "is_active"],
+            )
+            replaced = [row for row in changed if row.parameters is not None]
+            ProductParameter.objects.filter(
+                product_info_id__in=[row.product_info_id for row in replaced]
+            ).delete()
+            for row, product_info in zip(created, product_infos):
+                row.product_info_id = product_info.id
+            ProductParameter.objects.bulk_create(
+                [
+                    ProductParameter(
+                        product_info_id=row.product_info_id,
+                        parameter_id=parameter_id,
+                        value=value,
+                    )
+                    for row in created + replaced
+                    for parameter_id, value in row.parameters
+                ]
+            )
+            facet_delta.update(
+                _facet_counts(affected + [row.product_info_id for row in created])
+            )
+        facet_delta.subtract(_retire_missing(shop, external_ids, batch_size))
+        _apply_facet_delta(shop, facet_delta, batch_size)
+
+
+def _facet_counts(product_info_ids):
+    """
+    Посчитать значения параметров товаров на продаже из product_info_ids
+    по ключу (категория, параметр, значение)
+    """
+
+    if not product_info_ids:
+        return Counter()
+    return Counter(
+        {
+            (category_id, parameter_id, value): count
+            for category_id, parameter_id, value, count in ProductParameter.objects.filter(
+                product_info_id__in=product_info_ids, product_info__is_active=True
+            )
+            .values_list("product_info__product__category", "parameter", "value")
+            .annotate(count=Count("id"))
+            .order_by()
+        }
+    )
+
+
+def _apply_facet_delta(shop, delta, batch_size):
+    """
+    Применить изменения к счетчикам FacetCount магазина:
+    затрагиваются только значения параметров измененных товаров
+    """
+
+    delta = {key: value for key, value in delta.items() if value}
+    if not delta:
+        return
+    facets = {
+        (facet.category_id, facet.parameter_id, facet.value): facet
+        for facet in FacetCount.objects.filter(
+            shop=shop,
+            category_id__in={category_id for category_id, _, _ in delta},
+            parameter_id__in={parameter_id for _, parameter_id, _ in delta},
+        )
+    }
+    created, changed, emptied = [], [], []
+    for key, value in delta.items():
+        facet = facets.get(key)
+        if facet is None:
+            if value > 0:
+                category_id, parameter_id, facet_value = key
+                created.append(
+                    FacetCount(
+                        shop=shop,
+                        category_id=category_id,
+                        parameter_id=parameter_id,
+                        value=facet_value,
+                        count=value,
+                    )
+                )
+        elif facet.count + value > 0:
+            facet.count += value
+            changed.append(facet)
+        else:
+            emptied.append(facet.id)
+    FacetCount.objects.bulk_create(created, batch_size=batch_size)
+    FacetCount.objects.bulk_update(changed, ["count"], batch_size=batch_size)
+    for ids in _chunked(emptied, batch_size):
+        FacetCount.objects.filter(id__in=ids).delete()
+
+
+def _retire_missing(shop, external_ids, batch_size):
+    """
+    Снять с продажи товары магазина, которых нет в загруженном списке.
+    Возвращает снятые с продажи значения параметров для счетчиков FacetCount
+    """
+
+    missing = [
+        product_info_id
+        for product_info_id, external_id in ProductInfo.objects.filter(
+            shop=shop, is_active=True
+        ).values_list("id", "external_id")
+        if external_id not in external_ids
+    ]
+    retired = Counter()
+    for ids in _chunked(missing, batch_size):
+        retired.update(_facet_counts(ids))
+        ProductInfo.objects.filter(id__in=ids).update(is_active=False)
+    return retired
+
+
+MAX_VALIDATION_ERRORS = 100
+
+GOODS_FIELDS = (
+    "id",
+    "category",
+    "model",
+    "name",
+    "price",
+    "price_rrc",
+    "quantity",
+    "parameters",
+)
+
+
+def _is_id(value):
+    return type(value) == int and value > 0
+
+
+def _check_text(errors, path, value, field, required=True):
+    if type(value) != str or (required and not value):
+        errors.append(f"{path}: Не указаны даннные или неверный тип данных (строка)")
+    elif len(value) > field.max_length:
+        errors.append(f"{path}: Длина превышает {field.max_length} символов")
+
+
+def _check_category(errors, path, category, names):
+    if type(category) != dict:
+        errors.append(f"{path}: Неверный тип данных (словарь)")
+        return
+    if not _is_id(category.get("id")):
+        errors.append(
+            f"{path}.id: Не указаны даннные или неверный тип данных (целое число больше 0)"
+        )
+    elif category["id"] in names and names[category["id"]] != category.get("name"):
+        errors.append(f"{path}.id: Повторяется ИД категории {category['id']}")
+    else:
+        names[category["id"]] = category.get("name")
+    _check_text(
+        errors, f"{path}.name", category.get("name"), Category._meta.get_field("name")
+    )
+
+
+def _check_item(errors, path, item, names, external_ids, unknown_categories):
+    if type(item) != dict:
+        errors.append(f"{path}: Неверный тип данных (словарь)")
+        return
+    for key in GOODS_FIELDS:
+        if key not in item:
+            errors.append(f"{path}.{key}: Не указаны даннные")
+    if "id" in item:
+        if not _is_id(item["id"]):
+            errors.append(f"{path}.id: Неверный тип данных (целое число больше 0)")
+        elif item["id"] in external_ids:
+            errors.append(f"{path}.id: Повторяется ИД товара {item['id']}")
+        else:
+            external_ids.add(item["id"])
+    if "category" in item:
+        if not _is_id(item["category"]):
+            errors.append(
+                f"{path}.category: Неверный тип данных (целое число больше 0)"
+            )
+        elif item["category"] not in names:
+            unknown_categories.setdefault(item["category"], []).append(path)
+    if "name" in item:
+        _check_text(
+            errors, f"{path}.name", item["name"], Product._meta.get_field("name")
+        )
+    if "model" in item:
+        _check_text(
+            errors,
+            f"{path}.model",
+            item["model"],
+            ProductInfo._meta.get_field("model"),
+            required=False,
+        )
+    for key in ("price", "price_rrc", "quantity"):
+        if key in item and not (type(item[key]) == int and item[key] >= 0):
+            errors.append(f"{path}.{key}: Неверный тип данных (целое число от 0)")
+    if "parameters" in item:
+        if type(item["parameters"]) != dict:
+            errors.append(f"{path}.parameters: Неверный тип данных (словарь)")
+            return
+        for name, value in item["parameters"].items():
+            _check_text(
+                errors,
+                f"{path}.parameters",
+                name,
+                Parameter._meta.get_field("name"),
+            )
+            if value == "" or type(value) not in (str, int, float):
+                errors.append(
+                    f"{path}.parameters.{name}: Не указаны даннные или неверный тип данных"
+                )
+            elif len(str(value)) > ProductParameter._meta.get_field("value").max_length:
+                errors.append(
+                    f"{path}.parameters.{name}: Длина превышает "
+                    f"{ProductParameter._meta.get_field('value').max_length} символов"
+                )
+
+
+def validate_pricelist(data):
+    """
+    Проверить весь список товаров до записи в базу данных.
+    Возвращает все найденные ошибки с указанием места, например
+    "goods[3].price: ...". Пустой список - данные корректны.
+    Список без товаров считается ошибкой: его загрузка сняла бы с продажи
+    весь каталог магазина (для этого есть удаление списка товаров).
+    База данных только читается: ищутся категории, не описанные в файле
+    """
+
+    errors, names, external_ids, unknown_categories = [], {}, set(), {}
+    missing = [section for section in PRICELIST_SECTIONS if section not in data.keys()]
+    if missing:
+        return [f"{section}: Не указаны даннные" for section in missing]
+    goods = 0
+    try:
+        for index, category in enumerate(data["categories"]):
+            _check_category(errors, f"categories[{index}]", category, names)
+        for goods, item in enumerate(data["goods"], 1):
+            _check_item(
+                errors,
+                f"goods[{goods - 1}]",
+                item,
+                names,
+                external_ids,
+                unknown_categories,
+            )
+    except PricelistFormatError as error:
+        errors.append(str(error))
+    else:
+        if not goods:
+            errors.append("goods: Не указаны даннные (список товаров пуст)")
+    known = set()
+    for ids in _chunked(unknown_categories, settings.PRICELIST_BATCH_SIZE):
+        known.update(Category.objects.filter(id__in=ids).values_list("id", flat=True))
+    for category_id, paths in unknown_categories.items():
+        if category_id not in known:
+            errors.extend(
+                f"{path}.category: Категория {category_id} не найдена" for path in paths
+            )
+    if len(errors) > MAX_VALIDATION_ERRORS:
+        errors[MAX_VALIDATION_ERRORS:] = [
+            f"... и еще {len(errors) - MAX_VALIDATION_ERRORS} ошибок"
+        ]
+    return errors
+
+
+def _iter_batches(shop, data, batch_size):
+    """
+    Создать категории списка товаров и по пачкам отдавать товары.
+    Данные должны быть предварительно проверены validate_pricelist
+    """
+
+    _resolve_categories(shop, data["categories"])
+    yield from _chunked(data["goods"], batch_size)
+
+
+def import_pricelist(data, shop_id, force=False, job_id=None):
+    """
+    Загрузить список товаров синхронно. Список с подозрительными изменениями
+    цен и количеств не публикуется, если не указан force.
+    Если указан job_id, список публикуется, только пока загрузка job_id
+    удерживает блокировку магазина
+    """
+
+    errors = validate_pricelist(data)
+    if errors:
+        return {"Errors": errors}
+    shop = Shop.objects.get(id=shop_id)
+    batch_size = settings.PRICELIST_BATCH_SIZE
+    products, parameters, external_ids, staged, arrays = {}, {}, set(), [], []
+    try:
+        for goods in _iter_batches(shop, data, batch_size):
+            staged.extend(_plan_goods(shop, goods, products, parameters))
+            external_ids.update(item["id"] for item in goods)
+            arrays.append(goods_arrays(goods))
+        report = check_anomalies(shop, arrays)
+        if report["held"] and not force:
+            return {"Errors": anomaly_errors(report)}
+        with transaction.atomic():
+            if (
+                job_id is not None
+                and not Shop.objects.select_for_update()
+                .filter(id=shop.id, import_job=job_id)
+                .exists()
+            ):
+                return {
+                    "Error": "Загрузка прервана: магазин загружает более новый список"
+                }
+            _publish(shop, staged, external_ids, batch_size)
+    except PricelistFormatError as error:
+        return {"Error": str(error)}
+    except (IntegrityError, KeyError) as error:
+        return {"Errors": str(error)}
+    return True
+
+
+def diff_pricelist(data, shop_id):
+    """
+    Сравнить список товаров с текущим каталогом магазина без записи в базу:
+    число добавляемых, снимаемых с продажи, изменивших цену и прочих
+    изменившихся товаров и примеры каждого вида.
+    Выполняется в транзакции только для чтения, которая затем откатывается
+    """
+
+    errors = validate_pricelist(data)
+    if errors:
+        return {"Errors": errors}
+    shop = Shop.objects.get(id=shop_id)
+    sample_size = settings.PRICELIST_DIFF_SAMPLE_SIZE
+    counts = {"added": 0, "removed": 0, "price_changed": 0, "changed": 0}
+    samples = {"added": [], "removed": [], "price_changed": []}
+    products, parameters, external_ids = {}, {}, set()
+    try:
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION READ ONLY")
+            _check_category_names(
+                {category["id"]: category["name"] for category in data["categories"]}
+            )
+            for goods in _chunked(data["goods"], settings.PRICELIST_BATCH_SIZE):
+                items = {item["id"]: item for item in goods}
+                external_ids.update(items)
+                staged = _plan_goods(shop, goods, products, parameters, create=False)
+                current = {
+                    product_info_id: (price, is_active)
+                    for product_info_id, price, is_active in ProductInfo.objects.filter(
+                        id__in=[row.product_info_id for row in staged]
+                    ).values_list("id", "price", "is_active")
+                }
+                for row in staged:
+                    old_price, is_active = current.get(
+                        row.product_info_id, (None, False)
+                    )
+                    if not is_active:
+                        kind = "added"
+                    elif old_price != row.price:
+                        kind = "price_changed"
                     else:
-                        return {
-                            "Error": "Ошибка при обработки значений 'goods'. Не указаны даннные или неверный тип данных (name)"
+                        counts["changed"] += 1
+                        continue
+                    counts[kind] += 1
+                    if len(samples[kind]) < sample_size:
+                        item = items[row.external_id]
+                        sample = {
+                            "id": item["id"],
+                            "name": item["name"],
+                            "price": item["price"],
                         }
-        else:
-            return {
-                "Error": "Ошибка при обработки значений 'categories'. Не указаны даннные или неверный тип данных"
-            }
+                        if kind == "price_changed":
+                            sample["old_price"] = old_price
+                        samples[kind].append(sample)
+            removed = set(
+                ProductInfo.objects.filter(shop=shop, is_active=True).values_list(
+                    "external_id", flat=True
+                )
+            ).difference(external_ids)
+            counts["removed"] = len(removed)
+            samples["removed"] = [
+                {
+                    "id": product_info.external_id,
+                    "name": product_info.product.name,
+                    "price": product_info.price,
+                }
+                for product_info in ProductInfo.objects.filter(
+                    shop=shop, external_id__in=sorted(removed)[:sample_size]
+                )
+                .select_related("product")
+                .order_by("external_id")
+            ]
+            transaction.set_rollback(True)
+    except IntegrityError as error:
+        return {"Errors": str(error)}
+    counts["unchanged"] = (
+        len(external_ids)
+        - counts["added"]
+        - counts["price_changed"]
+        - counts["changed"]
+    )
+    return {**counts, "samples": samples}
+
+
+def split_pricelist(data, shop_id):
+    """
+    Подготовить параллельную загрузку списка товаров: проверить данные,
+    последовательно создать справочные записи (категории, продукты, имена
+    параметров) и разложить товары по частям в хранилище.
+    Возвращает ИД частей, ИД файла с внешними ИД товаров, число товаров
+    и отчет о подозрительных изменениях цен и количеств.
+    Части затем загружаются независимо через import_pricelist_chunk
+    """
+
+    errors = validate_pricelist(data)
+    if errors:
+        return {"Errors": errors}
+    shop = Shop.objects.get(id=shop_id)
+    products, parameters, external_ids, chunks, arrays = {}, {}, set(), [], []
+    try:
+        for goods in _iter_batches(shop, data, settings.PRICELIST_CHUNK_SIZE):
+            external_ids.update(item["id"] for item in goods)
+            arrays.append(goods_arrays(goods))
+            _resolve_products(goods, products)
+            _resolve_parameters(goods, parameters)
+            chunks.append(save_payload(goods))
+    except (PricelistFormatError, IntegrityError, KeyError) as error:
+        for blob_id in chunks:
+            delete_blob(blob_id)
+        if isinstance(error, PricelistFormatError):
+            return {"Error": str(error)}
+        return {"Errors": str(error)}
+    return {
+        "chunks": chunks,
+        "external_ids": save_payload(sorted(external_ids)),
+        "rows": len(external_ids),
+        "anomalies": check_anomalies(shop, arrays),
+    }
+
+
+def import_pricelist_chunk(goods, job_id, chunk):
+    """
+    Подготовить часть списка товаров: изменения сохраняются в StagedProductInfo
+    и публикуются в finish_pricelist. Справочные записи уже созданы в split_pricelist,
+    поэтому параллельные части только читают их.
+    Подготовленные строки, отметка ImportCheckpoint и счетчик загрузки
+    сохраняются одной транзакцией, повторная обработка части пропускается
+    """
+
+    job = ImportJob.objects.select_related("shop").get(id=job_id)
+    batch_size = settings.PRICELIST_BATCH_SIZE
+    products, parameters = {}, {}
+    try:
+        with transaction.atomic():
+            if ImportCheckpoint.objects.filter(job=job, chunk=chunk).exists():
+                return True
+            _stage_chunk(job, goods, batch_size, products, parameters)
+            ImportCheckpoint.objects.create(job=job, chunk=chunk, rows=len(goods))
+            ImportJob.objects.filter(id=job.id).update(
+                rows_processed=F("rows_processed") + len(goods)
+            )
+    except (IntegrityError, KeyError) as error:
+        return {"Errors": str(error)}
+    return True
+
+
+def _stage_chunk(job, goods, batch_size, products, parameters):
+    for batch in _chunked(goods, batch_size):
+        staged = _plan_goods(job.shop, batch, products, parameters)
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                copy_loader.copy_staged(
+                    cursor, copy_loader.STAGED_TABLE, job.id, staged
+                )
+            continue
+        for row in staged:
+            row.job = job
+        StagedProductInfo.objects.bulk_create(staged)
+
+
+def finish_pricelist(results, external_ids, job_id):
+    """
+    Завершить параллельную загрузку: если все части подготовлены, опубликовать
+    изменения и снять с продажи отсутствующие в списке товары одной транзакцией.
+    Подготовленные строки удаляются в той же транзакции, поэтому повторный
+    запуск после сбоя не применит их дважды. При ошибке каталог магазина остается прежним.
+    Загрузка публикуется, только пока удерживает блокировку магазина: потерявшая
+    ее по таймауту загрузка иначе перезаписала бы более новую
+    """
+
+    job = ImportJob.objects.select_related("shop").get(id=job_id)
+    staged = StagedProductInfo.objects.filter(job=job)
+    for result in results:
+        if result != True:
+            staged.delete()
+            return result
+    batch_size = settings.PRICELIST_BATCH_SIZE
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            copy_loader.analyze_staged(cursor)
+    try:
+        with transaction.atomic():
+            if (
+                not Shop.objects.select_for_update()
+                .filter(id=job.shop_id, import_job=job.id)
+                .exists()
+            ):
+                staged.delete()
+                return {
+                    "Error": "Загрузка прервана: магазин загружает более новый список"
+                }
+            _publish(
+                job.shop,
+                staged.order_by("id").iterator(chunk_size=batch_size),
+                set(external_ids),
+                batch_size,
+                job.id,
+            )
+            staged.delete()
+    except IntegrityError as error:
+        staged.delete()
+        return {"Errors": str(error)}
     return True
+
+
+STOCK_FIELDS = ("price", "quantity")
+
+
+def check_stock_item(errors, path, item):
+    """
+    Проверить одно обновление цены и остатка, ошибки дописываются в errors.
+    Возвращает True, если обновление можно применить
+    """
+
+    if type(item) != dict:
+        errors.append(f"{path}: Неверный тип данных (словарь)")
+        return False
+    count = len(errors)
+    if not _is_id(item.get("external_id")):
+        errors.append(
+            f"{path}.external_id: Не указаны даннные или неверный тип данных (целое число больше 0)"
+        )
+    if not any(key in item for key in STOCK_FIELDS):
+        errors.append(f"{path}: Не указаны даннные (price, quantity)")
+    for key in STOCK_FIELDS:
+        if key in item and not (type(item[key]) == int and item[key] >= 0):
+            errors.append(f"{path}.{key}: Неверный тип данных (целое число от 0)")
+    return len(errors) == count
+
+
+def validate_stock(goods):
+    """
+    Проверить список обновлений цен и остатков, ошибки возвращаются с указанием места
+    """
+
+    errors, external_ids = [], set()
+    for index, item in enumerate(goods):
+        path = f"goods[{index}]"
+        if check_stock_item(errors, path, item):
+            if item["external_id"] in external_ids:
+                errors.append(
+                    f"{path}.external_id: Повторяется ИД товара {item['external_id']}"
+                )
+            external_ids.add(item["external_id"])
+        if len(errors) > MAX_VALIDATION_ERRORS:
+            break
+    return errors[:MAX_VALIDATION_ERRORS]
+
+
+def _update_stock(shop_id, batch):
+    """
+    Обновить цены и остатки пачки товаров одним запросом UPDATE ... FROM (VALUES ...).
+    Возвращает внешние ИД обновленных товаров
+    """
+
+    if connection.vendor != "postgresql":
+        product_infos = list(
+            ProductInfo.objects.filter(
+                shop_id=shop_id, is_active=True, external_id__in=list(batch)
+            ).only("id", "external_id", *STOCK_FIELDS)
+        )
+        for product_info in product_infos:
+            for key in STOCK_FIELDS:
+                if batch[product_info.external_id][key] is not None:
+                    setattr(product_info, key, batch[product_info.external_id][key])
+        ProductInfo.objects.bulk_update(product_infos, STOCK_FIELDS)
+        return [product_info.external_id for product_info in product_infos]
+    values = ", ".join(["(%s, %s::integer, %s::integer)"] * len(batch))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {ProductInfo._meta.db_table} product_info
+            SET price = COALESCE(stock.price, product_info.price),
+                quantity = COALESCE(stock.quantity, product_info.quantity)
+            FROM (VALUES {values}) AS stock (external_id, price, quantity)
+            WHERE product_info.shop_id = %s
+                AND product_info.is_active
+                AND product_info.external_id = stock.external_id
+            RETURNING product_info.external_id
+            """,
+            [
+                *(
+                    value
+                    for external_id, item in batch.items()
+                    for value in (external_id, item["price"], item["quantity"])
+                ),
+                shop_id,
+            ],
+        )
+        return [external_id for external_id, in cursor.fetchall()]
+
+
+def sync_stock(shop_id, goods):
+    """
+    Обновить только цены и остатки выставленных товаров магазина по внешним ИД.
+    goods - проверенный validate_stock список {external_id, price, quantity},
+    price или quantity можно не указывать. Возвращает число обновленных товаров
+    и ИД товаров, не найденных в списке магазина
+    """
+
+    updated, unknown = 0, []
+    with transaction.atomic():
+        for chunk in _chunked(goods, settings.PRICELIST_SYNC_BATCH_SIZE):
+            batch = {
+                item["external_id"]: {key: item.get(key) for key in STOCK_FIELDS}
+                for item in chunk
+            }
+            found = set(_update_stock(shop_id, batch))
+            updated += len(found)
+            unknown.extend(
+                external_id for external_id in batch if external_id not in found
+            )
+        if updated:
+            Shop.objects.filter(id=shop_id).update(pricelist_hash="")
+    return {"updated": updated, "unknown": unknown}
+
+
+class _LineReader:
+    """
+    Чтение строк потока в отдельном потоке. get ждет следующую строку
+    не дольше timeout, поэтому обработчик может применить накопленные
+    обновления по сроку, даже если новых строк нет
+    """
+
+    END = object()
+
+    def __init__(self, lines, size):
+        self.queue = Queue(size)
+        self.stopped = threading.Event()
+        threading.Thread(target=self.read, args=(lines,), daemon=True).start()
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read(self, lines):
+        try:
+            for line in lines:
+                if not self.put(line):
+                    return
+        except Exception as error:
+            self.put(error)
+            return
+        self.put(self.END)
+
+    def get(self, timeout):
+        """
+        Следующая строка, END в конце потока, None - если за timeout секунд
+        строк не было
+        """
+
+        try:
+            item = self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def close(self):
+        self.stopped.set()
+
+
+def stream_stock(shop_id, lines):
+    """
+    Применять поток обновлений цен и остатков в формате NDJSON (одно
+    {external_id, price, quantity} на строку) пачками: при накоплении
+    PRICELIST_STREAM_BATCH_SIZE обновлений или через PRICELIST_STREAM_FLUSH_MS
+    миллисекунд после первого из них, даже если новые строки не поступают.
+    Ошибочные строки пропускаются. Отдает строки с ходом обработки, последняя - итог
+    """
+
+    batch_size = settings.PRICELIST_STREAM_BATCH_SIZE
+    flush_after = settings.PRICELIST_STREAM_FLUSH_MS / 1000
+    pending, errors = {}, []
+    total = {"rows": 0, "updated": 0, "unknown": 0}
+    pending_since = number = 0
+
+    def flush():
+        result = sync_stock(shop_id, list(pending.values()))
+        pending.clear()
+        total["updated"] += result["updated"]
+        total["unknown"] += len(result["unknown"])
+        return json.dumps(total) + "\n"
+
+    reader = _LineReader(lines, batch_size)
+    try:
+        while True:
+            line = reader.get(
+                max(0, pending_since + flush_after - time.monotonic())
+                if pending
+                else None
+            )
+            if line is _LineReader.END:
+                break
+            if line is not None:
+                number += 1
+                if not line.strip():
+                    continue
+                total["rows"] += 1
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    item = None
+                    errors.append(f"line[{number}]: Ошибка разбора JSON")
+                else:
+                    if check_stock_item(errors, f"line[{number}]", item):
+                        if not pending:
+                            pending_since = time.monotonic()
+                        pending.setdefault(
+                            item["external_id"], {"external_id": item["external_id"]}
+                        ).update(
+                            {key: item[key] for key in STOCK_FIELDS if key in item}
+                        )
+                del errors[MAX_VALIDATION_ERRORS:]
+            if pending and (
+                len(pending) >= batch_size
+                or time.monotonic() - pending_since >= flush_after
+            ):
+                yield flush()
+    finally:
+        reader.close()
+    if pending:
+        yield flush()
+    yield json.dumps(
+        {
+            "Status": True,
+            "Rows": total["rows"],
+            "Updated": total["updated"],
+            "Unknown": total["unknown"],
+            "Errors": errors[:MAX_VALIDATION_ERRORS],
+        },
+        ensure_ascii=False,
+    ) + "\n"
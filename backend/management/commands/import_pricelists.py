@@ -0,0 +1,163 @@
+import json
+import os
+import time
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from backend.import_view import import_pricelist
+from backend.models import ImportJob, ProductInfo, Shop
+from backend.parsers import PRICELIST_EXTENSIONS
+from backend.storage import load_pricelist_file
+from backend.tasks import _acquire_import_lock, _finish_job, supersede_imports
+
+
+def _result_errors(result):
+    errors = result.get("Errors", result.get("Error"))
+    return "; ".join(errors) if type(errors) == list else str(errors)
+
+
+def import_file(path, shop_id, force):
+    """
+    Загрузить файл списка товаров магазина тем же механизмом, что и import_pricelist.
+    Загрузка записывается в ImportJob и держит блокировку магазина, как загрузка
+    через Celery: магазин, который уже загружает список, пропускается, ожидающие
+    и задержанные загрузки магазина заменяются.
+    Возвращает имя файла, ИД магазина, число товаров на продаже, время и ошибку
+    """
+
+    started = time.monotonic()
+    rows = 0
+    job = ImportJob.objects.create(
+        shop_id=shop_id, state="running", started_at=timezone.now()
+    )
+    if _acquire_import_lock(job):
+        supersede_imports(shop_id)
+        try:
+            data = load_pricelist_file(
+                path, PRICELIST_EXTENSIONS[os.path.splitext(path)[1].lower()]
+            )
+            result = import_pricelist(data, shop_id, force, job.id)
+        except Exception as exception:
+            result = {"Error": f"{type(exception).__name__}: {exception}"}
+        if result == True:
+            rows = ProductInfo.objects.filter(shop=shop_id, is_active=True).count()
+            ImportJob.objects.filter(id=job.id).update(
+                rows_total=rows, rows_processed=rows
+            )
+    else:
+        result = {"Error": "Магазин уже загружает другой список товаров"}
+    # снимает блокировку и сбрасывает хэш последнего списка магазина
+    _finish_job(job.id, result)
+    error = "" if result == True else _result_errors(result)
+    return os.path.basename(path), shop_id, rows, time.monotonic() - started, error
+
+
+def _import_file(task):
+    return import_file(*task)
+
+
+class Command(BaseCommand):
+    help = (
+        "Загрузить списки товаров из файлов каталога в несколько процессов. "
+        "Файл относится к магазину по имени файла (ИД или название магазина) "
+        "или по файлу соответствия --mapping"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Каталог с файлами списков товаров")
+        parser.add_argument(
+            "--mapping",
+            help="JSON-файл соответствия {имя файла: ИД или название магазина}",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=min(os.cpu_count() or 1, settings.PRICELIST_IMPORT_PROCESSES),
+            help="Число процессов загрузки, каждый держит одно соединение с базой",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Загружать списки с подозрительными изменениями цен и количеств",
+        )
+
+    def get_shop(self, key):
+        key = str(key)
+        lookup = {"id": int(key)} if key.isdigit() else {"name": key}
+        return Shop.objects.filter(**lookup).values_list("id", flat=True).first()
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        if not os.path.isdir(directory):
+            raise CommandError(f"Каталог {directory} не найден")
+        mapping = {}
+        if options["mapping"]:
+            with open(options["mapping"], encoding="utf-8") as mapping_file:
+                mapping = json.load(mapping_file)
+
+        tasks, results, shops = [], [], set()
+        for name in sorted(os.listdir(directory)):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() not in PRICELIST_EXTENSIONS:
+                continue
+            shop_id = self.get_shop(mapping.get(name, stem))
+            if shop_id is None:
+                results.append((name, None, 0, 0.0, "Магазин не найден"))
+            elif shop_id in shops:
+                results.append(
+                    (name, shop_id, 0, 0.0, "Для магазина уже указан другой файл")
+                )
+            else:
+                shops.add(shop_id)
+                tasks.append((os.path.join(directory, name), shop_id, options["force"]))
+
+        started = time.monotonic()
+        processes = max(1, min(options["processes"], len(tasks)))
+        if processes == 1:
+            results.extend(map(_import_file, tasks))
+        else:
+            # дочерние процессы открывают собственные соединения с базой
+            connections.close_all()
+            with Pool(processes) as pool:
+                for result in pool.imap_unordered(_import_file, tasks):
+                    self.stdout.write(f"{result[0]}: {'ошибка' if result[4] else 'ok'}")
+                    results.append(result)
+        self.write_summary(
+            sorted(results, key=lambda result: result[0]), time.monotonic() - started
+        )
+        failed = sum(1 for result in results if result[4])
+        if failed:
+            raise CommandError(f"Не загружено файлов: {failed} из {len(results)}")
+
+    def write_summary(self, results, elapsed):
+        header = ("Файл", "Магазин", "Товаров", "Время, с", "Ошибка")
+        table = [
+            (
+                name,
+                "" if shop_id is None else str(shop_id),
+                str(rows),
+                f"{seconds:.2f}",
+                error,
+            )
+            for name, shop_id, rows, seconds, error in results
+        ]
+        widths = [
+            max(len(row[column]) for row in [header, *table])
+            for column in range(len(header) - 1)
+        ]
+        for row in [header, *table]:
+            self.stdout.write(
+                "  ".join(
+                    [value.ljust(width) for value, width in zip(row, widths)]
+                    + [row[-1]]
+                ).rstrip()
+            )
+        self.stdout.write(
+            f"Загружено файлов: {sum(1 for result in results if not result[4])} "
+            f"из {len(results)}, товаров: {sum(result[2] for result in results)}, "
+            f"время: {elapsed:.2f} с"
+        )
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.5 on 2026-10-17 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productinfo",
+            name="is_active",
+            field=models.BooleanField(
+                default=True, verbose_name="Есть в списке товаров"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(
+                fields=["shop", "external_id"], name="product_info_external_id"
+            ),
+        ),
+    ]
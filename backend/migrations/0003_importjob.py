@@ -0,0 +1,91 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0002_productinfo_is_active"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "task_id",
+                    models.CharField(
+                        blank=True, max_length=50, verbose_name="ИД задачи"
+                    ),
+                ),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("queued", "В очереди"),
+                            ("running", "Загружается"),
+                            ("done", "Завершена"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="queued",
+                        max_length=15,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "rows_total",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Всего товаров"
+                    ),
+                ),
+                (
+                    "rows_processed",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Загружено товаров"
+                    ),
+                ),
+                (
+                    "errors",
+                    models.JSONField(blank=True, default=list, verbose_name="Ошибки"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создана"),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="Начата"),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Завершена"
+                    ),
+                ),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="import_jobs",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Загрузка списка товаров",
+                "verbose_name_plural": "Список загрузок списков товаров",
+                "ordering": ("-created_at",),
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0003_importjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, max_length=64, verbose_name="Хэш списка товаров"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shop",
+            name="pricelist_hash",
+            field=models.CharField(
+                blank=True,
+                max_length=64,
+                verbose_name="Хэш последнего загруженного списка товаров",
+            ),
+        ),
+    ]
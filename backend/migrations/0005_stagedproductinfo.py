@@ -0,0 +1,81 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0004_pricelist_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StagedProductInfo",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("external_id", models.PositiveIntegerField(verbose_name="Внешний ИД")),
+                (
+                    "model",
+                    models.CharField(blank=True, max_length=80, verbose_name="Модель"),
+                ),
+                ("quantity", models.PositiveIntegerField(verbose_name="Количество")),
+                ("price", models.PositiveIntegerField(verbose_name="Цена")),
+                (
+                    "price_rrc",
+                    models.PositiveIntegerField(
+                        verbose_name="Рекомендуемая розничная цена"
+                    ),
+                ),
+                (
+                    "parameters",
+                    models.JSONField(
+                        blank=True,
+                        null=True,
+                        verbose_name="Параметры [[ИД параметра, значение], ...]",
+                    ),
+                ),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="staged_product_infos",
+                        to="backend.importjob",
+                        verbose_name="Загрузка",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="staged",
+                        to="backend.product",
+                        verbose_name="Продукт",
+                    ),
+                ),
+                (
+                    "product_info",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="staged",
+                        to="backend.productinfo",
+                        verbose_name="Информация о продукте",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Подготовленная запись о продукте",
+                "verbose_name_plural": "Подготовленные записи о продуктах",
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0005_stagedproductinfo"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="shop",
+            name="import_job",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="backend.importjob",
+                verbose_name="Загрузка, удерживающая блокировку",
+            ),
+        ),
+        migrations.AddField(
+            model_name="shop",
+            name="import_locked_at",
+            field=models.DateTimeField(
+                blank=True,
+                null=True,
+                verbose_name="Время получения блокировки загрузки",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="importjob",
+            name="state",
+            field=models.CharField(
+                choices=[
+                    ("queued", "В очереди"),
+                    ("running", "Загружается"),
+                    ("done", "Завершена"),
+                    ("failed", "Ошибка"),
+                    ("superseded", "Заменена более новой загрузкой"),
+                ],
+                default="queued",
+                max_length=15,
+                verbose_name="Статус",
+            ),
+        ),
+    ]
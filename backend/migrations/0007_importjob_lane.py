@@ -0,0 +1,22 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0006_import_lock"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="lane",
+            field=models.CharField(
+                choices=[("fast", "Небольшие списки"), ("bulk", "Большие списки")],
+                default="fast",
+                max_length=5,
+                verbose_name="Очередь",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0007_importjob_lane"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="plan",
+            field=models.JSONField(
+                blank=True,
+                null=True,
+                verbose_name="Части списка товаров для возобновления загрузки",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("chunk", models.CharField(max_length=50, verbose_name="ИД части")),
+                ("rows", models.PositiveIntegerField(verbose_name="Товаров в части")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Подготовлена"
+                    ),
+                ),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="checkpoints",
+                        to="backend.importjob",
+                        verbose_name="Загрузка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Подготовленная часть загрузки",
+                "verbose_name_plural": "Подготовленные части загрузок",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="importcheckpoint",
+            constraint=models.UniqueConstraint(
+                fields=("job", "chunk"), name="unique_import_checkpoint"
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0008_importcheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PricelistUpload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "format",
+                    models.CharField(max_length=10, verbose_name="Формат файла"),
+                ),
+                (
+                    "size",
+                    models.PositiveBigIntegerField(
+                        blank=True, null=True, verbose_name="Размер файла"
+                    ),
+                ),
+                (
+                    "received",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Принято байт"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создана"),
+                ),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pricelist_uploads",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Загрузка файла списка товаров",
+                "verbose_name_plural": "Список загрузок файлов списков товаров",
+                "ordering": ("-created_at",),
+            },
+        ),
+    ]
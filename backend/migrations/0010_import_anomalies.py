@@ -0,0 +1,53 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:45
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0009_pricelistupload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="anomalies",
+            field=models.JSONField(
+                blank=True,
+                null=True,
+                verbose_name="Подозрительные изменения цен и количеств",
+            ),
+        ),
+        migrations.AddField(
+            model_name="shop",
+            name="anomaly_threshold",
+            field=models.FloatField(
+                blank=True,
+                default=0.2,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(0),
+                    django.core.validators.MaxValueValidator(1),
+                ],
+                verbose_name="Доля подозрительных изменений, при которой загрузка задерживается",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="importjob",
+            name="state",
+            field=models.CharField(
+                choices=[
+                    ("queued", "В очереди"),
+                    ("running", "Загружается"),
+                    ("done", "Завершена"),
+                    ("failed", "Ошибка"),
+                    ("superseded", "Заменена более новой загрузкой"),
+                    ("held", "Задержана: подозрительные изменения цен и количеств"),
+                ],
+                default="queued",
+                max_length=15,
+                verbose_name="Статус",
+            ),
+        ),
+    ]
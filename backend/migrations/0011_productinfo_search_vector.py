@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-17 07:55
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = """
+    UPDATE backend_productinfo product_info
+    SET search_vector =
+        setweight(to_tsvector('russian', product.name), 'A')
+        || setweight(to_tsvector('russian', product_info.model), 'B')
+        || setweight(to_tsvector('russian', coalesce(category.name, '')), 'C')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(product_parameter.value, ' ')
+            FROM backend_productparameter product_parameter
+            WHERE product_parameter.product_info_id = product_info.id
+        ), '')), 'D')
+    FROM backend_product product
+    LEFT JOIN backend_category category ON category.id = product.category_id
+    WHERE product.id = product_info.product_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """
+    GIN-индекс и заполнение векторов существующих товаров только для PostgreSQL
+    """
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(SEARCH_VECTOR_SQL)
+    schema_editor.execute(
+        "CREATE INDEX product_info_search ON backend_productinfo "
+        "USING gin (search_vector)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS product_info_search")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0010_import_anomalies"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productinfo",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
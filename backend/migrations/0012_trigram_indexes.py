@@ -0,0 +1,42 @@
+from django.db import migrations
+
+TRIGRAM_INDEXES = {
+    "product_name_trgm": "backend_product",
+    "category_name_trgm": "backend_category",
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Расширение pg_trgm и триграммные GIN-индексы по названиям продуктов и категорий.
+    На других СУБД и серверах PostgreSQL без pg_trgm подсказки работают без индексов
+    """
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for index, table in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index} ON {table} USING gin (name gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for index in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0011_productinfo_search_vector"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
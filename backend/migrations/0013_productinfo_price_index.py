@@ -0,0 +1,16 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0012_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(fields=["price", "id"], name="product_info_price"),
+        ),
+    ]
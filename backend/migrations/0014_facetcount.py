@@ -0,0 +1,112 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_facet_counts(apps, schema_editor):
+    """
+    Счетчики значений параметров для уже загруженных списков товаров
+    """
+
+    FacetCount = apps.get_model("backend", "FacetCount")
+    ProductParameter = apps.get_model("backend", "ProductParameter")
+    FacetCount.objects.bulk_create(
+        [
+            FacetCount(
+                shop_id=shop_id,
+                category_id=category_id,
+                parameter_id=parameter_id,
+                value=value,
+                count=count,
+            )
+            for shop_id, category_id, parameter_id, value, count in (
+                ProductParameter.objects.filter(product_info__is_active=True)
+                .values_list(
+                    "product_info__shop",
+                    "product_info__product__category",
+                    "parameter",
+                    "value",
+                )
+                .annotate(count=Count("id"))
+                .order_by()
+            )
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0013_productinfo_price_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.CharField(max_length=100, verbose_name="Значение")),
+                (
+                    "count",
+                    models.PositiveIntegerField(
+                        verbose_name="Число товаров на продаже"
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="facet_counts",
+                        to="backend.category",
+                        verbose_name="Категория",
+                    ),
+                ),
+                (
+                    "parameter",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="facet_counts",
+                        to="backend.parameter",
+                        verbose_name="Параметр",
+                    ),
+                ),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="facet_counts",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Счетчик значения параметра",
+                "verbose_name_plural": "Счетчики значений параметров",
+                "indexes": [
+                    models.Index(
+                        fields=["category", "parameter"], name="facet_count_category"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="facetcount",
+            constraint=models.UniqueConstraint(
+                fields=("shop", "category", "parameter", "value"),
+                name="unique_facet_count",
+            ),
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
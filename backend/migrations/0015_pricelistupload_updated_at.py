@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-17 08:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0014_facetcount"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pricelistupload",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="Последняя часть",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,139 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:10
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_product_info(apps, keep_id, duplicate):
+    """
+    Перенести заказанные позиции и подготовленные строки дубля
+    записи ProductInfo на запись keep_id и удалить дубль
+    """
+
+    OrderItem = apps.get_model("backend", "OrderItem")
+    StagedProductInfo = apps.get_model("backend", "StagedProductInfo")
+    for order_item in OrderItem.objects.filter(product_info=duplicate):
+        kept = OrderItem.objects.filter(
+            order_id=order_item.order_id, product_info_id=keep_id
+        ).first()
+        if kept is None:
+            order_item.product_info_id = keep_id
+            order_item.save(update_fields=["product_info"])
+        else:
+            kept.quantity += order_item.quantity
+            kept.save(update_fields=["quantity"])
+            order_item.delete()
+    StagedProductInfo.objects.filter(product_info=duplicate).update(
+        product_info_id=keep_id
+    )
+    duplicate.delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Объединить продукты с одинаковыми (название, категория) и одноименные
+    параметры, созданные параллельными загрузками, в запись с наименьшим ИД
+    """
+
+    Product = apps.get_model("backend", "Product")
+    ProductInfo = apps.get_model("backend", "ProductInfo")
+    StagedProductInfo = apps.get_model("backend", "StagedProductInfo")
+    Parameter = apps.get_model("backend", "Parameter")
+    ProductParameter = apps.get_model("backend", "ProductParameter")
+    FacetCount = apps.get_model("backend", "FacetCount")
+
+    for row in (
+        Product.objects.values("name", "category")
+        .annotate(keep=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    ):
+        duplicates = Product.objects.filter(
+            name=row["name"], category=row["category"]
+        ).exclude(id=row["keep"])
+        for product_info in ProductInfo.objects.filter(product__in=duplicates):
+            kept = ProductInfo.objects.filter(
+                product_id=row["keep"],
+                shop_id=product_info.shop_id,
+                external_id=product_info.external_id,
+            ).first()
+            if kept is not None:
+                merge_product_info(apps, kept.id, product_info)
+            else:
+                product_info.product_id = row["keep"]
+                product_info.save(update_fields=["product"])
+        StagedProductInfo.objects.filter(product__in=duplicates).update(
+            product_id=row["keep"]
+        )
+        duplicates.delete()
+
+    replaced = {}
+    for row in (
+        Parameter.objects.values("name")
+        .annotate(keep=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    ):
+        for parameter_id in (
+            Parameter.objects.filter(name=row["name"])
+            .exclude(id=row["keep"])
+            .values_list("id", flat=True)
+        ):
+            replaced[parameter_id] = row["keep"]
+    if not replaced:
+        return
+    for product_parameter in ProductParameter.objects.filter(
+        parameter_id__in=list(replaced)
+    ):
+        keep = replaced[product_parameter.parameter_id]
+        if ProductParameter.objects.filter(
+            product_info_id=product_parameter.product_info_id, parameter_id=keep
+        ).exists():
+            product_parameter.delete()
+        else:
+            product_parameter.parameter_id = keep
+            product_parameter.save(update_fields=["parameter"])
+    for staged in StagedProductInfo.objects.filter(parameters__isnull=False):
+        parameters = {}
+        for parameter_id, value in staged.parameters:
+            parameters.setdefault(replaced.get(parameter_id, parameter_id), value)
+        staged.parameters = [list(item) for item in parameters.items()]
+        staged.save(update_fields=["parameters"])
+
+    # счетчики объединенных параметров пересчитываются заново
+    kept = set(replaced.values())
+    FacetCount.objects.filter(parameter_id__in=[*replaced, *kept]).delete()
+    FacetCount.objects.bulk_create(
+        [
+            FacetCount(
+                shop_id=shop_id,
+                category_id=category_id,
+                parameter_id=parameter_id,
+                value=value,
+                count=count,
+            )
+            for shop_id, category_id, parameter_id, value, count in (
+                ProductParameter.objects.filter(
+                    parameter_id__in=kept, product_info__is_active=True
+                )
+                .values_list(
+                    "product_info__shop",
+                    "product_info__product__category",
+                    "parameter",
+                    "value",
+                )
+                .annotate(count=Count("id"))
+                .order_by()
+            )
+        ],
+        batch_size=1000,
+    )
+    Parameter.objects.filter(id__in=list(replaced)).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0015_pricelistupload_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
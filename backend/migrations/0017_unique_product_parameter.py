@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0016_merge_duplicate_products"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="product",
+            constraint=models.UniqueConstraint(
+                fields=("name", "category"), name="unique_product"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="parameter",
+            constraint=models.UniqueConstraint(
+                fields=("name",), name="unique_parameter"
+            ),
+        ),
+    ]
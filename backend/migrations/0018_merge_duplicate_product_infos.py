@@ -0,0 +1,58 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:20
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_product_info(apps, keep_id, duplicate):
+    """
+    Перенести заказанные позиции и подготовленные строки дубля
+    записи ProductInfo на запись keep_id и удалить дубль
+    """
+
+    OrderItem = apps.get_model("backend", "OrderItem")
+    StagedProductInfo = apps.get_model("backend", "StagedProductInfo")
+    for order_item in OrderItem.objects.filter(product_info=duplicate):
+        kept = OrderItem.objects.filter(
+            order_id=order_item.order_id, product_info_id=keep_id
+        ).first()
+        if kept is None:
+            order_item.product_info_id = keep_id
+            order_item.save(update_fields=["product_info"])
+        else:
+            kept.quantity += order_item.quantity
+            kept.save(update_fields=["quantity"])
+            order_item.delete()
+    StagedProductInfo.objects.filter(product_info=duplicate).update(
+        product_info_id=keep_id
+    )
+    duplicate.delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Оставить по одной записи ProductInfo на (магазин, внешний ИД):
+    товар на продаже, а среди них последний загруженный
+    """
+
+    ProductInfo = apps.get_model("backend", "ProductInfo")
+    for row in (
+        ProductInfo.objects.values("shop", "external_id")
+        .annotate(total=Count("id"))
+        .filter(total__gt=1)
+    ):
+        keep, *duplicates = ProductInfo.objects.filter(
+            shop_id=row["shop"], external_id=row["external_id"]
+        ).order_by("-is_active", "-id")
+        for duplicate in duplicates:
+            merge_product_info(apps, keep.id, duplicate)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0017_unique_product_parameter"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
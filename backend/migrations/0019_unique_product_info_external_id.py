@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0018_merge_duplicate_product_infos"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="productinfo",
+            name="unique_product_info",
+        ),
+        migrations.RemoveIndex(
+            model_name="productinfo",
+            name="product_info_external_id",
+        ),
+        migrations.AddConstraint(
+            model_name="productinfo",
+            constraint=models.UniqueConstraint(
+                fields=("shop", "external_id"), name="unique_product_info_external_id"
+            ),
+        ),
+    ]
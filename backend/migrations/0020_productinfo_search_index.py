@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:14
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=["search_vector"], name="product_info_search"
+)
+
+
+def add_search_index(apps, schema_editor):
+    """
+    Заменить GIN-индекс, созданный SQL в 0011, индексом из ProductInfo.Meta.
+    На других СУБД индекса нет, как и в 0011
+    """
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS product_info_search")
+    schema_editor.add_index(apps.get_model("backend", "ProductInfo"), SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0019_unique_product_info_external_id"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                # обратная миграция оставляет индекс, который создает 0011
+                migrations.RunPython(add_search_index, migrations.RunPython.noop),
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name="productinfo", index=SEARCH_INDEX),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-17 09:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def delete_uncategorized(apps, schema_editor):
+    """
+    Счетчики без категории не создаются: у продукта категория обязательна
+    """
+
+    apps.get_model("backend", "FacetCount").objects.filter(
+        category__isnull=True
+    ).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("backend", "0020_productinfo_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_uncategorized, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="facetcount",
+            name="category",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="facet_counts",
+                to="backend.category",
+                verbose_name="Категория",
+            ),
+        ),
+    ]
@@ -3,8 +3,12 @@ from django.contrib.auth.password_validation import (
     CommonPasswordValidator, MinimumLengthValidator, NumericPasswordValidator,
     UserAttributeSimilarityValidator)
 from django.contrib.auth.validators import UnicodeUsernameValidator
-from django.core.validators import EmailValidator, URLValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import (EmailValidator, MaxValueValidator,
+                                    MinValueValidator, URLValidator)
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 
@@ -20,6 +24,20 @@ STATE_CHOICES = (
     ("canceled", "Отменен"),
 )
 
+IMPORT_STATE_CHOICES = (
+    ("queued", "В очереди"),
+    ("running", "Загружается"),
+    ("done", "Завершена"),
+    ("failed", "Ошибка"),
+    ("superseded", "Заменена более новой загрузкой"),
+    ("held", "Задержана: подозрительные изменения цен и количеств"),
+)
+
+IMPORT_LANE_CHOICES = (
+    ("fast", "Небольшие списки"),
+    ("bulk", "Большие списки"),
+)
+
 CLIENT_TYPE_CHOICES = (
     ("shop", "Магазин"),
     ("buyer", "Покупатель"),
@@ -123,6 +141,29 @@ class Shop(models.Model):
         on_delete=models.CASCADE,
     )
     state = models.BooleanField(verbose_name="статус получения заказов", default=True)
+    pricelist_hash = models.CharField(
+        verbose_name="Хэш последнего загруженного списка товаров",
+        max_length=64,
+        blank=True,
+    )
+    import_job = models.ForeignKey(
+        "ImportJob",
+        verbose_name="Загрузка, удерживающая блокировку",
+        related_name="+",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    import_locked_at = models.DateTimeField(
+        verbose_name="Время получения блокировки загрузки", null=True, blank=True
+    )
+    anomaly_threshold = models.FloatField(
+        verbose_name="Доля подозрительных изменений, при которой загрузка задерживается",
+        null=True,
+        blank=True,
+        default=0.2,
+        validators=[MinValueValidator(0), MaxValueValidator(1)],
+    )
 
     class Meta:
         verbose_name = "Магазин"
@@ -162,6 +203,9 @@ class Product(models.Model):
         verbose_name = "Продукт"
         verbose_name_plural = "Список продуктов"
         ordering = ("-name",)
+        constraints = [
+            models.UniqueConstraint(fields=["name", "category"], name="unique_product"),
+        ]
 
     def __str__(self):
         return self.name
@@ -187,15 +231,23 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name="Количество")
     price = models.PositiveIntegerField(verbose_name="Цена")
     price_rrc = models.PositiveIntegerField(verbose_name="Рекомендуемая розничная цена")
+    is_active = models.BooleanField(verbose_name="Есть в списке товаров", default=True)
+    search_vector = SearchVectorField(
+        verbose_name="Поисковый вектор", null=True, editable=False
+    )
 
     class Meta:
         verbose_name = "Информация о продукте"
         verbose_name_plural = "Информационный список о продуктах"
         constraints = [
             models.UniqueConstraint(
-                fields=["product", "shop", "external_id"], name="unique_product_info"
+                fields=["shop", "external_id"], name="unique_product_info_external_id"
             ),
         ]
+        indexes = [
+            models.Index(fields=["price", "id"], name="product_info_price"),
+            GinIndex(fields=["search_vector"], name="product_info_search"),
+        ]
 
 
 class Parameter(models.Model):
@@ -205,6 +257,9 @@ class Parameter(models.Model):
         verbose_name = "Имя параметра"
         verbose_name_plural = "Список имен параметров"
         ordering = ("-name",)
+        constraints = [
+            models.UniqueConstraint(fields=["name"], name="unique_parameter"),
+        ]
 
     def __str__(self):
         return self.name
@@ -237,6 +292,188 @@ class ProductParameter(models.Model):
         ]
 
 
+class FacetCount(models.Model):
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="facet_counts",
+        on_delete=models.CASCADE,
+    )
+    category = models.ForeignKey(
+        Category,
+        verbose_name="Категория",
+        related_name="facet_counts",
+        on_delete=models.CASCADE,
+    )
+    parameter = models.ForeignKey(
+        Parameter,
+        verbose_name="Параметр",
+        related_name="facet_counts",
+        on_delete=models.CASCADE,
+    )
+    value = models.CharField(verbose_name="Значение", max_length=100)
+    count = models.PositiveIntegerField(verbose_name="Число товаров на продаже")
+
+    class Meta:
+        verbose_name = "Счетчик значения параметра"
+        verbose_name_plural = "Счетчики значений параметров"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "category", "parameter", "value"],
+                name="unique_facet_count",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["category", "parameter"], name="facet_count_category"),
+        ]
+
+    def __str__(self):
+        return f"{self.parameter} = {self.value}"
+
+
+class ImportJob(models.Model):
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="import_jobs",
+        on_delete=models.CASCADE,
+    )
+    task_id = models.CharField(verbose_name="ИД задачи", max_length=50, blank=True)
+    content_hash = models.CharField(
+        verbose_name="Хэш списка товаров", max_length=64, blank=True
+    )
+    state = models.CharField(
+        verbose_name="Статус",
+        choices=IMPORT_STATE_CHOICES,
+        max_length=15,
+        default="queued",
+    )
+    lane = models.CharField(
+        verbose_name="Очередь",
+        choices=IMPORT_LANE_CHOICES,
+        max_length=5,
+        default="fast",
+    )
+    rows_total = models.PositiveIntegerField(verbose_name="Всего товаров", default=0)
+    rows_processed = models.PositiveIntegerField(
+        verbose_name="Загружено товаров", default=0
+    )
+    errors = models.JSONField(verbose_name="Ошибки", default=list, blank=True)
+    plan = models.JSONField(
+        verbose_name="Части списка товаров для возобновления загрузки",
+        null=True,
+        blank=True,
+    )
+    anomalies = models.JSONField(
+        verbose_name="Подозрительные изменения цен и количеств",
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(verbose_name="Создана", auto_now_add=True)
+    started_at = models.DateTimeField(verbose_name="Начата", null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name="Завершена", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Загрузка списка товаров"
+        verbose_name_plural = "Список загрузок списков товаров"
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.shop} {self.created_at}"
+
+    @property
+    def rows_per_second(self):
+        if not self.started_at or not self.rows_processed:
+            return 0
+        seconds = (
+            (self.finished_at or timezone.now()) - self.started_at
+        ).total_seconds()
+        return round(self.rows_processed / seconds, 1) if seconds else 0
+
+
+class PricelistUpload(models.Model):
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="pricelist_uploads",
+        on_delete=models.CASCADE,
+    )
+    format = models.CharField(verbose_name="Формат файла", max_length=10)
+    size = models.PositiveBigIntegerField(
+        verbose_name="Размер файла", null=True, blank=True
+    )
+    received = models.PositiveBigIntegerField(verbose_name="Принято байт", default=0)
+    created_at = models.DateTimeField(verbose_name="Создана", auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name="Последняя часть", auto_now=True)
+
+    class Meta:
+        verbose_name = "Загрузка файла списка товаров"
+        verbose_name_plural = "Список загрузок файлов списков товаров"
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.shop} {self.created_at}"
+
+
+class ImportCheckpoint(models.Model):
+    job = models.ForeignKey(
+        ImportJob,
+        verbose_name="Загрузка",
+        related_name="checkpoints",
+        on_delete=models.CASCADE,
+    )
+    chunk = models.CharField(verbose_name="ИД части", max_length=50)
+    rows = models.PositiveIntegerField(verbose_name="Товаров в части")
+    created_at = models.DateTimeField(verbose_name="Подготовлена", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Подготовленная часть загрузки"
+        verbose_name_plural = "Подготовленные части загрузок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["job", "chunk"], name="unique_import_checkpoint"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.job} {self.chunk}"
+
+
+class StagedProductInfo(models.Model):
+    job = models.ForeignKey(
+        ImportJob,
+        verbose_name="Загрузка",
+        related_name="staged_product_infos",
+        on_delete=models.CASCADE,
+    )
+    product_info = models.ForeignKey(
+        ProductInfo,
+        verbose_name="Информация о продукте",
+        related_name="staged",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+    )
+    external_id = models.PositiveIntegerField(verbose_name="Внешний ИД")
+    product = models.ForeignKey(
+        Product,
+        verbose_name="Продукт",
+        related_name="staged",
+        on_delete=models.CASCADE,
+    )
+    model = models.CharField(max_length=80, verbose_name="Модель", blank=True)
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    price = models.PositiveIntegerField(verbose_name="Цена")
+    price_rrc = models.PositiveIntegerField(verbose_name="Рекомендуемая розничная цена")
+    parameters = models.JSONField(
+        verbose_name="Параметры [[ИД параметра, значение], ...]", null=True, blank=True
+    )
+
+    class Meta:
+        verbose_name = "Подготовленная запись о продукте"
+        verbose_name_plural = "Подготовленные записи о продуктах"
+
+
 class Contact(models.Model):
     client = models.ForeignKey(
         Client,
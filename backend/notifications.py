@@ -126,3 +126,20 @@ def notific_import_pricelist(email, result, datetime):
             f"УВЕДОМЛЯЕМ ВАС ОБ НЕУДАЧНОМ ЗАВЕРШЕНИИ ЗАГРУЗКИ СПИСКА ТОВАРОВ ВАШЕГО МАГАЗИНА. ОШИБКА - {result}"
         )
         return
+
+
+def notific_import_held(email, job_id, errors):
+    """
+    Отправить письмо о задержанной загрузке списка товаров
+    """
+    # send_mail(
+    #     "РАЗМЕЩЕНИЕ СПИСКА ТОВАРОВ",
+    #     f"ЗАГРУЗКА СПИСКА ТОВАРОВ ВАШЕГО МАГАЗИНА № {job_id} ЗАДЕРЖАНА. {errors}. ДЛЯ ПУБЛИКАЦИИ ПОДТВЕРДИТЕ ЗАГРУЗКУ В ПРОФИЛЕ МАГАЗИНА",
+    #     "from@example.com",
+    #     [f"{email}"],
+    #     fail_silently=False,
+    # )
+
+    print(
+        f"ЗАГРУЗКА СПИСКА ТОВАРОВ ВАШЕГО МАГАЗИНА № {job_id} ЗАДЕРЖАНА. {errors}. ДЛЯ ПУБЛИКАЦИИ ПОДТВЕРДИТЕ ЗАГРУЗКУ В ПРОФИЛЕ МАГАЗИНА"
+    )
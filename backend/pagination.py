@@ -0,0 +1,174 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       LimitOffsetPagination)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Постраничный вывод по курсору: следующая страница выбирается условием
+    price > %s OR (price = %s AND id > %s) вместо OFFSET, поэтому время
+    выборки не зависит ни от номера страницы, ни от числа одинаковых цен.
+    Общее число записей не считается. Ключи сортировки - поля модели по
+    возрастанию, последним уникальное, задаются в атрибуте представления
+    cursor_orderings {значение параметра ordering: поля}, по умолчанию первый из них
+    """
+
+    page_size_query_param = "limit"
+    max_page_size = 1000
+    ordering_query_param = "ordering"
+
+    def get_ordering(self, request, queryset, view):
+        orderings = getattr(view, "cursor_orderings", {"id": ("id",)})
+        return orderings.get(
+            request.query_params.get(self.ordering_query_param),
+            next(iter(orderings.values())),
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        queryset = queryset.order_by(
+            *(f"-{field}" if reverse else field for field in self.ordering)
+        )
+        if self.cursor is not None:
+            queryset = self.filter_position(queryset, self.cursor.position, reverse)
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        if self.template is not None:
+            self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def filter_position(self, queryset, position, reverse):
+        """
+        Записи после (или до при reverse) позиции курсора по ключу сортировки
+        """
+
+        options = queryset.model._meta
+        try:
+            # значения подделанного курсора проверяются как значения полей
+            values = [
+                options.get_field(field).clean(value, None)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        lookup = "lt" if reverse else "gt"
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            condition |= Q(
+                **dict(zip(self.ordering[:index], values)),
+                **{f"{field}__{lookup}": values[index]},
+            )
+        return queryset.filter(condition)
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if type(position) != list or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor._replace(position=position)
+
+    def encode_position(self, instance, reverse):
+        return self.encode_cursor(
+            Cursor(
+                offset=0,
+                reverse=reverse,
+                position=json.dumps(
+                    [getattr(instance, field) for field in self.ordering]
+                ),
+            )
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_position(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_position(self.page[0], True)
+
+
+class OptionalCursorPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination по умолчанию, по курсору (KeysetPagination) -
+    при параметре pagination=cursor или при переданном курсоре.
+    Время выборки страницы по курсору не зависит от ее номера
+    """
+
+    mode_query_param = "pagination"
+    keyset = None
+
+    def is_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_keyset(request):
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination()
+        page = self.keyset.paginate_queryset(queryset, request, view)
+        self.display_page_controls = self.keyset.display_page_controls
+        return page
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset:
+            return self.keyset.to_html()
+        return super().to_html()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        names = {parameter["name"] for parameter in parameters}
+        keyset_parameters = [
+            parameter
+            for parameter in KeysetPagination().get_schema_operation_parameters(view)
+            if parameter["name"] not in names
+        ]
+        return [
+            *parameters,
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "cursor - постраничный вывод по курсору без подсчета записей",
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            *keyset_parameters,
+            {
+                "name": KeysetPagination.ordering_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Ключ сортировки при выводе по курсору: "
+                + ", ".join(getattr(view, "cursor_orderings", {"id": ("id",)})),
+                "schema": {"type": "string"},
+            },
+        ]
@@ -0,0 +1,324 @@
+import csv
+import hashlib
+import json
+import os
+
+import msgpack
+import yaml
+
+PRICELIST_CONTENT_TYPES = {
+    "application/json": "json",
+    "application/yaml": "yaml",
+    "application/x-yaml": "yaml",
+    "text/yaml": "yaml",
+    "text/csv": "csv",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+}
+
+PRICELIST_EXTENSIONS = {
+    ".json": "json",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".csv": "csv",
+    ".msgpack": "msgpack",
+    ".mpk": "msgpack",
+}
+
+BINARY_FORMATS = ("msgpack",)
+
+CSV_INTEGER_COLUMNS = ("id", "category", "price", "price_rrc", "quantity")
+CSV_PARAMETER_PREFIX = "parameters."
+
+PRICELIST_SECTIONS = ("categories", "goods")
+
+READ_SIZE = 64 * 1024
+
+
+class PricelistFormatError(ValueError):
+    pass
+
+
+def detect_format(uploaded_file):
+    """
+    Определить формат загруженного списка товаров по Content-Type или расширению файла
+    """
+
+    content_type = (uploaded_file.content_type or "").split(";")[0].strip()
+    if content_type in PRICELIST_CONTENT_TYPES:
+        return PRICELIST_CONTENT_TYPES[content_type]
+    return PRICELIST_EXTENSIONS.get(os.path.splitext(uploaded_file.name)[1].lower())
+
+
+class _JsonReader:
+    """
+    Инкрементальное чтение JSON: в памяти держится только текущий буфер
+    и разбираемый элемент массива
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.stream.read(READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer):
+                if not self.buffer[self.position].isspace():
+                    return self.buffer[self.position]
+                self.position += 1
+            if not self._fill():
+                raise PricelistFormatError("Неожиданный конец файла JSON")
+
+    def expect(self, *chars):
+        char = self.peek()
+        if char not in chars:
+            raise PricelistFormatError(
+                f"Ошибка разбора JSON: ожидался символ {' или '.join(chars)}, получен '{char}'"
+            )
+        self.position += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as error:
+                if self.eof or not self._fill():
+                    raise PricelistFormatError(f"Ошибка разбора JSON: {error}")
+                continue
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def sections(self, section):
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key == section:
+                self.expect("[")
+                if self.peek() == "]":
+                    self.position += 1
+                else:
+                    while True:
+                        yield self.value()
+                        if self.expect(",", "]") == "]":
+                            break
+                return
+            self.skip()
+            if self.expect(",", "}") == "}":
+                return
+
+    def skip(self):
+        if self.peek() != "[":
+            self.value()
+            return
+        self.position += 1
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            self.value()
+            if self.expect(",", "]") == "]":
+                return
+
+
+def _iter_json(stream, section):
+    yield from _JsonReader(stream).sections(section)
+
+
+def _skip_yaml_node(loader):
+    if not loader.check_event(yaml.SequenceStartEvent):
+        loader.compose_node(None, None)
+        return
+    loader.get_event()
+    while not loader.check_event(yaml.SequenceEndEvent):
+        loader.compose_node(None, None)
+    loader.get_event()
+
+
+def _iter_yaml(stream, section):
+    loader = yaml.SafeLoader(stream)
+    try:
+        loader.get_event()
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise PricelistFormatError("Ошибка разбора YAML: ожидался словарь")
+        loader.get_event()
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_document(loader.compose_node(None, None))
+            if key != section:
+                _skip_yaml_node(loader)
+                continue
+            if not loader.check_event(yaml.SequenceStartEvent):
+                raise PricelistFormatError(
+                    f"Ошибка разбора YAML: '{section}' должен быть списком"
+                )
+            loader.get_event()
+            while not loader.check_event(yaml.SequenceEndEvent):
+                yield loader.construct_document(loader.compose_node(None, None))
+            return
+    except yaml.YAMLError as error:
+        raise PricelistFormatError(f"Ошибка разбора YAML: {error}")
+    finally:
+        loader.dispose()
+
+
+def _csv_integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _csv_item(row):
+    item = {
+        key: _csv_integer(value) if key in CSV_INTEGER_COLUMNS else value
+        for key, value in row.items()
+        if key != "parameters" and not key.startswith(CSV_PARAMETER_PREFIX)
+    }
+    if row.get("parameters"):
+        try:
+            item["parameters"] = json.loads(row["parameters"])
+        except ValueError:
+            item["parameters"] = row["parameters"]
+    else:
+        item["parameters"] = {}
+    if type(item["parameters"]) == dict:
+        item["parameters"].update(
+            (key[len(CSV_PARAMETER_PREFIX) :], value)
+            for key, value in row.items()
+            if key.startswith(CSV_PARAMETER_PREFIX) and value
+        )
+    return item
+
+
+def _iter_csv(stream, section):
+    """
+    Таблица товаров: строка заголовка и по строке на товар. Параметры задаются
+    колонкой parameters (JSON-объект) и/или колонками parameters.<название>.
+    Категории берутся из колонок category и category_name
+    """
+
+    header = stream.readline().lstrip("\ufeff")
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    fields = next(csv.reader([header], delimiter=delimiter), None)
+    if not fields:
+        return
+    rows = csv.DictReader(stream, fieldnames=fields, delimiter=delimiter)
+    try:
+        if section == "goods":
+            for row in rows:
+                if None in row:
+                    raise PricelistFormatError(
+                        f"Ошибка разбора CSV: лишние значения в строке {rows.line_num + 1}"
+                    )
+                row.pop("category_name", None)
+                yield _csv_item(row)
+            return
+        if "category_name" not in fields:
+            return
+        seen = set()
+        for row in rows:
+            category = (_csv_integer(row.get("category")), row["category_name"])
+            if category not in seen:
+                seen.add(category)
+                yield {"id": category[0], "name": category[1]}
+    except csv.Error as error:
+        raise PricelistFormatError(f"Ошибка разбора CSV: {error}")
+
+
+def _iter_msgpack(stream, section):
+    unpacker = msgpack.Unpacker(stream, raw=False, read_size=READ_SIZE)
+    try:
+        for _ in range(unpacker.read_map_header()):
+            if unpacker.unpack() != section:
+                unpacker.skip()
+                continue
+            for _ in range(unpacker.read_array_header()):
+                yield unpacker.unpack()
+            return
+    except (ValueError, msgpack.UnpackException) as error:
+        raise PricelistFormatError(f"Ошибка разбора msgpack: {error}")
+
+
+READERS = {
+    "json": _iter_json,
+    "yaml": _iter_yaml,
+    "csv": _iter_csv,
+    "msgpack": _iter_msgpack,
+}
+
+
+def iter_section(open_stream, pricelist_format, section):
+    """
+    Потоково прочитать элементы раздела списка товаров из файла
+    """
+
+    with open_stream(binary=pricelist_format in BINARY_FORMATS) as stream:
+        try:
+            yield from READERS[pricelist_format](stream, section)
+        except UnicodeDecodeError as error:
+            raise PricelistFormatError(
+                f"Ошибка кодировки: файл не в {error.encoding}, "
+                "укажите charset в Content-Type"
+            )
+
+
+class PricelistFile:
+    """
+    Список товаров в файле. Разделы читаются потоково при каждом обращении,
+    поэтому объект можно передать в import_pricelist вместо словаря.
+    open_stream - функция, открывающая файл как текстовый поток
+    или как двоичный при binary=True
+    """
+
+    def __init__(self, open_stream, pricelist_format):
+        self.open_stream = open_stream
+        self.format = pricelist_format
+
+    def __getitem__(self, section):
+        if section not in PRICELIST_SECTIONS:
+            raise KeyError(section)
+        return iter_section(self.open_stream, self.format, section)
+
+    def keys(self):
+        return PRICELIST_SECTIONS
+
+
+def pricelist_hash(data):
+    """
+    Канонический хэш содержимого списка товаров: не зависит от формата файла,
+    порядка ключей и форматирования, разделы читаются потоково
+    """
+
+    digest = hashlib.sha256()
+    for section in PRICELIST_SECTIONS:
+        digest.update(f"{section}\n".encode())
+        for item in data[section]:
+            digest.update(
+                json.dumps(
+                    item, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+                ).encode()
+            )
+            digest.update(b"\n")
+    return digest.hexdigest()
@@ -1,7 +1,9 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 
-from backend.models import (Category, Client, Contact, Order, OrderItem,
-                            Product, ProductInfo, ProductParameter, Shop)
+from backend.models import (Category, Client, Contact, ImportJob, Order,
+                            OrderItem, Product, ProductInfo, ProductParameter,
+                            Shop)
 
 
 class ContactsSerializer(serializers.ModelSerializer):
@@ -92,11 +94,25 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("id",)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Загрузить вложенные объекты сериализатора заранее: продукт с категорией
+        и магазин в основном запросе, параметры с именами одним доп. запросом
+        """
+
+        return queryset.select_related("product__category", "shop").prefetch_related(
+            Prefetch(
+                "product_parameters",
+                queryset=ProductParameter.objects.select_related("parameter"),
+            )
+        )
+
 
 class ShopSerializer(serializers.ModelSerializer):
     class Meta:
         model = Shop
-        fields = ("id", "name", "url", "client", "state")
+        fields = ("id", "name", "url", "client", "state", "anomaly_threshold")
         read_only_fields = ("id",)
 
 
@@ -107,6 +123,11 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
         extra_kwargs = {"order": {"write_only": True}}
 
+    def validate_product_info(self, value):
+        if not value.is_active:
+            raise serializers.ValidationError("Товар снят с продажи")
+        return value
+
 
 class OrderItemCreateSerializer(OrderItemSerializer):
     product_info = ProductInfoSerializer(read_only=True)
@@ -129,3 +150,24 @@ class OrderSerializer(serializers.ModelSerializer):
             "contact",
         )
         read_only_fields = ("id",)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.ReadOnlyField()
+
+    class Meta:
+        model = ImportJob
+        fields = (
+            "id",
+            "state",
+            "lane",
+            "rows_total",
+            "rows_processed",
+            "rows_per_second",
+            "errors",
+            "anomalies",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+        read_only_fields = fields
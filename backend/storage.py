@@ -0,0 +1,188 @@
+import codecs
+import gzip
+import json
+import os
+import shutil
+import uuid
+from functools import partial
+
+from django.conf import settings
+
+from backend.parsers import BINARY_FORMATS, READ_SIZE, PricelistFile
+
+COMPRESS_LEVEL = 6
+
+
+def _blob_path(blob_id):
+    return os.path.join(settings.PRICELIST_BLOB_DIR, f"{blob_id}.gz")
+
+
+def _blob_charset(charset, pricelist_format):
+    """
+    Кодировка текстового файла не в UTF-8 для ИД файла, неизвестная кодировка
+    не учитывается (файл читается как UTF-8 и отклоняется при ошибке)
+    """
+
+    if not charset or pricelist_format in BINARY_FORMATS:
+        return None
+    try:
+        name = codecs.lookup(charset).name
+    except LookupError:
+        return None
+    return None if name == "utf-8" else name
+
+
+def _new_blob(pricelist_format, charset=None):
+    os.makedirs(settings.PRICELIST_BLOB_DIR, exist_ok=True)
+    charset = _blob_charset(charset, pricelist_format)
+    blob_id = ".".join(
+        part for part in (uuid.uuid4().hex, charset, pricelist_format) if part
+    )
+    return blob_id, _blob_path(blob_id)
+
+
+def save_payload(data):
+    """
+    Сохранить список товаров из тела запроса в хранилище в сжатом виде.
+    Возвращает ИД сохраненного файла
+    """
+
+    blob_id, path = _new_blob("json")
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL) as blob:
+        json.dump(data, blob, ensure_ascii=False)
+    return blob_id
+
+
+def _upload_path(upload_id):
+    return os.path.join(settings.PRICELIST_BLOB_DIR, "uploads", f"{upload_id}.part")
+
+
+def write_upload(upload_id, offset, stream, limit):
+    """
+    Записать часть файла загрузки по частям начиная с offset (принятый размер),
+    данные после offset от прерванной записи отбрасываются.
+    Читается не больше limit + 1 байт файла: размер больше limit
+    означает, что тело запроса превышает допустимый размер.
+    Возвращает новый размер принятого файла
+    """
+
+    path = _upload_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "r+b" if os.path.exists(path) else "wb") as part:
+        part.seek(offset)
+        part.truncate()
+        remaining = limit + 1 - offset
+        while remaining > 0 and (chunk := stream.read(min(READ_SIZE, remaining))):
+            part.write(chunk)
+            remaining -= len(chunk)
+        return part.tell()
+
+
+def truncate_upload(upload_id, size):
+    """
+    Отбросить данные файла загрузки после size (принятый размер)
+    """
+
+    with open(_upload_path(upload_id), "r+b") as part:
+        part.truncate(size)
+
+
+def save_upload_part(upload_id, pricelist_format):
+    """
+    Сжать полностью принятый файл загрузки в хранилище и удалить его.
+    Возвращает ИД сохраненного файла
+    """
+
+    blob_id, path = _new_blob(pricelist_format)
+    with gzip.open(path, "wb", compresslevel=COMPRESS_LEVEL) as blob:
+        with open(_upload_path(upload_id), "rb") as source:
+            shutil.copyfileobj(source, blob)
+    delete_upload(upload_id)
+    return blob_id
+
+
+def delete_upload(upload_id):
+    try:
+        os.remove(_upload_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+def save_upload(uploaded_file, pricelist_format):
+    """
+    Сжать загруженный файл списка товаров в хранилище, не читая его в память целиком.
+    Кодировка текстового файла берется из charset его Content-Type.
+    Возвращает ИД сохраненного файла
+    """
+
+    blob_id, path = _new_blob(pricelist_format, uploaded_file.charset)
+    with gzip.open(path, "wb", compresslevel=COMPRESS_LEVEL) as blob:
+        if hasattr(uploaded_file, "temporary_file_path"):
+            with open(uploaded_file.temporary_file_path(), "rb") as source:
+                shutil.copyfileobj(source, blob)
+        else:
+            for chunk in uploaded_file.chunks():
+                blob.write(chunk)
+    return blob_id
+
+
+def save_stream(stream, pricelist_format, charset=None):
+    """
+    Сжать список товаров из тела запроса в хранилище по мере чтения.
+    Текст в кодировке charset перекодируется при чтении из хранилища.
+    Возвращает ИД сохраненного файла
+    """
+
+    blob_id, path = _new_blob(pricelist_format, charset)
+    with gzip.open(path, "wb", compresslevel=COMPRESS_LEVEL) as blob:
+        shutil.copyfileobj(stream, blob, READ_SIZE)
+    return blob_id
+
+
+def open_blob(blob_id, binary=False):
+    if binary:
+        return gzip.open(_blob_path(blob_id), "rb")
+    parts = blob_id.split(".")
+    return gzip.open(
+        _blob_path(blob_id),
+        "rt",
+        encoding=parts[1] if len(parts) == 3 else "utf-8",
+    )
+
+
+def load_payload(blob_id):
+    with open_blob(blob_id) as blob:
+        return json.load(blob)
+
+
+def load_pricelist(blob_id):
+    """
+    Получить список товаров из хранилища для потокового чтения
+    """
+
+    return PricelistFile(partial(open_blob, blob_id), blob_id.rsplit(".", 1)[1])
+
+
+def open_file(path, binary=False):
+    if binary:
+        return open(path, "rb")
+    return open(path, encoding="utf-8")
+
+
+def load_pricelist_file(path, pricelist_format):
+    """
+    Получить список товаров из файла вне хранилища для потокового чтения
+    """
+
+    return PricelistFile(partial(open_file, path), pricelist_format)
+
+
+def blob_size(blob_id):
+    return os.path.getsize(_blob_path(blob_id))
+
+
+def delete_blob(blob_id):
+    try:
+        os.remove(_blob_path(blob_id))
+    except FileNotFoundError:
+        pass
@@ -1,7 +1,17 @@
 import datetime
 
+from celery import chord
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Q
+from django.utils import timezone
+
 import backend.notifications as note
-from backend.import_view import import_pricelist
+from backend.anomaly import anomaly_errors
+from backend.import_view import (finish_pricelist, import_pricelist_chunk,
+                                 split_pricelist)
+from backend.models import ImportCheckpoint, ImportJob, Shop, StagedProductInfo
+from backend.storage import delete_blob, load_payload, load_pricelist
 from marketplace.celery import celery_app
 
 
@@ -24,7 +34,231 @@ def celery_send_note(name_function, args):
         return
 
 
+def _result_errors(result):
+    errors = []
+    for value in result.values():
+        errors.extend(value if type(value) == list else [str(value)])
+    return errors
+
+
+def import_queue(lane):
+    return f"pricelist_{lane}"
+
+
+def _chunk_priority(index):
+    """
+    Приоритет части загрузки по ее номеру (в Redis 0 - наивысший): первые части
+    новой загрузки обгоняют дальние части большого списка, так что магазины
+    получают воркеры по очереди, а не в порядке поступления
+    """
+
+    return min(index, settings.PRICELIST_PRIORITY_STEPS - 1)
+
+
+def _acquire_import_lock(job):
+    """
+    Захватить блокировку загрузки магазина условным UPDATE: свободна,
+    уже принадлежит этой загрузке или удерживается дольше таймаута
+    """
+
+    now = timezone.now()
+    return bool(
+        Shop.objects.filter(id=job.shop_id)
+        .filter(
+            Q(import_job__isnull=True)
+            | Q(import_job=job.id)
+            | Q(
+                import_locked_at__lt=now
+                - datetime.timedelta(seconds=settings.PRICELIST_IMPORT_LOCK_TIMEOUT)
+            )
+        )
+        .update(import_job=job.id, import_locked_at=now)
+    )
+
+
+def _renew_import_lock(job_id):
+    """
+    Продлить блокировку магазина, пока загрузка идет: иначе загрузка дольше
+    PRICELIST_IMPORT_LOCK_TIMEOUT уступила бы ее следующей
+    """
+
+    Shop.objects.filter(import_job=job_id).update(import_locked_at=timezone.now())
+
+
+def _release_import_lock(shop_id, job_id):
+    Shop.objects.filter(id=shop_id, import_job=job_id).update(
+        import_job=None, import_locked_at=None
+    )
+
+
+def discard_import_plan(job_id):
+    """
+    Удалить подготовленные строки и части списка товаров в хранилище
+    задержанной, замененной, отмененной или прерванной загрузки
+    """
+
+    StagedProductInfo.objects.filter(job=job_id).delete()
+    plan = ImportJob.objects.filter(id=job_id).values_list("plan", flat=True).first()
+    if plan:
+        for blob_id in [*plan["chunks"], plan["external_ids"]]:
+            delete_blob(blob_id)
+
+
+def supersede_imports(shop_id):
+    """
+    Заменить ожидающие в очереди и задержанные загрузки магазина новой
+    """
+
+    superseded = ImportJob.objects.filter(shop=shop_id, state__in=("held", "queued"))
+    for job_id in list(superseded.values_list("id", flat=True)):
+        # подтвержденная задержанная загрузка в очереди уже разбита на части
+        if superseded.filter(id=job_id).update(
+            state="superseded", finished_at=timezone.now()
+        ):
+            discard_import_plan(job_id)
+
+
+def _finish_job(job_id, result):
+    job = ImportJob.objects.get(id=job_id)
+    ImportJob.objects.filter(id=job_id).update(
+        state="done" if result == True else "failed",
+        errors=[] if result == True else _result_errors(result),
+        finished_at=timezone.now(),
+    )
+    Shop.objects.filter(id=job.shop_id, import_job=job_id).update(
+        pricelist_hash=job.content_hash if result == True else "",
+        import_job=None,
+        import_locked_at=None,
+    )
+
+
+def _fail_import(job_id, email):
+    """
+    Завершить загрузку с ошибкой после сбоя задачи: удалить подготовленные
+    строки и части списка товаров из хранилища, освободить блокировку магазина
+    """
+
+    job = ImportJob.objects.filter(id=job_id).first()
+    if job is None or job.state not in ("queued", "running"):
+        return
+    discard_import_plan(job_id)
+    result = {"Error": "Загрузка прервана из-за внутренней ошибки, повторите загрузку"}
+    _finish_job(job_id, result)
+    note.notific_import_pricelist(email, result, datetime.datetime.now())
+
+
 @celery_app.task
-def celery_import_pricelist(data, shop, email):
-    result = import_pricelist(data, shop)
+def celery_fail_import_pricelist(request, exc, traceback, job_id, email):
+    """
+    Обработчик ошибки (link_error) завершения загрузки. Вызывается и при
+    ошибке любой из частей: тогда завершение загрузки не запускается
+    """
+
+    _fail_import(job_id, email)
+
+
+@celery_app.task(
+    bind=True, max_retries=None, acks_late=True, reject_on_worker_lost=True
+)
+def celery_import_pricelist(self, blob_id, job_id, email):
+    """
+    Разбить список товаров на части и запустить их загрузку. Если воркер
+    упал после разбиения, повторно доставленная задача берет части из
+    ImportJob.plan, а уже подготовленные части пропускаются по ImportCheckpoint.
+    Список с подозрительными изменениями цен и количеств задерживается
+    до подтверждения магазином, после которого задача запускается снова
+    """
+
+    job = ImportJob.objects.get(id=job_id)
+    if job.state not in ("queued", "running"):
+        # замененная или отмененная загрузка могла быть уже разбита на части
+        delete_blob(blob_id)
+        discard_import_plan(job_id)
+        return
+    if not _acquire_import_lock(job):
+        raise self.retry(countdown=settings.PRICELIST_IMPORT_RETRY_DELAY)
+    if job.state == "queued" and not ImportJob.objects.filter(
+        id=job_id, state="queued"
+    ).update(state="running", started_at=timezone.now()):
+        _release_import_lock(job.shop_id, job_id)
+        delete_blob(blob_id)
+        discard_import_plan(job_id)
+        return
+    if job.plan is None:
+        try:
+            result = split_pricelist(load_pricelist(blob_id), job.shop_id)
+            if "chunks" in result:
+                held = result["anomalies"]["held"]
+                ImportJob.objects.filter(id=job_id).update(
+                    plan=result,
+                    rows_total=result["rows"],
+                    anomalies=result["anomalies"],
+                    **(
+                        {"state": "held", "errors": anomaly_errors(result["anomalies"])}
+                        if held
+                        else {}
+                    ),
+                )
+        except Exception:
+            _fail_import(job_id, email)
+            raise
+        finally:
+            delete_blob(blob_id)
+        if "chunks" not in result:
+            _finish_job(job_id, result)
+            note.notific_import_pricelist(email, result, datetime.datetime.now())
+            return
+        if held:
+            _release_import_lock(job.shop_id, job_id)
+            note.notific_import_held(email, job_id, anomaly_errors(result["anomalies"]))
+            return
+        job.plan = result
+    _renew_import_lock(job_id)
+    queue = import_queue(job.lane)
+    finish = celery_finish_import_pricelist.s(
+        job.plan["external_ids"], job_id, email
+    ).set(queue=queue, priority=0)
+    finish.link_error(celery_fail_import_pricelist.s(job_id, email))
+    if not job.plan["chunks"]:
+        finish.apply_async(([],))
+        return
+    chord(
+        celery_import_pricelist_chunk.s(chunk, job_id).set(
+            queue=queue, priority=_chunk_priority(index)
+        )
+        for index, chunk in enumerate(job.plan["chunks"])
+    )(finish)
+
+
+# сбои базы данных повторяются: часть и ее файл в хранилище остаются до
+# сохранения ImportCheckpoint, поэтому повтор продолжает с той же части
+RETRY_OPTIONS = {
+    "acks_late": True,
+    "reject_on_worker_lost": True,
+    "autoretry_for": (DatabaseError,),
+    "retry_backoff": True,
+    "max_retries": settings.PRICELIST_IMPORT_MAX_RETRIES,
+}
+
+
+@celery_app.task(**RETRY_OPTIONS)
+def celery_import_pricelist_chunk(blob_id, job_id):
+    # части загрузки, прерванной ошибкой другой части, не обрабатываются
+    if (
+        ImportCheckpoint.objects.filter(job=job_id, chunk=blob_id).exists()
+        or ImportJob.objects.filter(id=job_id, state="failed").exists()
+    ):
+        delete_blob(blob_id)
+        return True
+    result = import_pricelist_chunk(load_payload(blob_id), job_id, blob_id)
+    delete_blob(blob_id)
+    _renew_import_lock(job_id)
+    return result
+
+
+@celery_app.task(**RETRY_OPTIONS)
+def celery_finish_import_pricelist(results, external_ids_blob_id, job_id, email):
+    result = finish_pricelist(results, load_payload(external_ids_blob_id), job_id)
+    delete_blob(external_ids_blob_id)
+    _finish_job(job_id, result)
     note.notific_import_pricelist(email, result, datetime.datetime.now())
@@ -1,12 +1,46 @@
+import base64
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from urllib.parse import urlencode
+
+import msgpack
+import yaml
+from celery.exceptions import Retry
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Count
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 
+from backend.anomaly import find_anomalies, goods_arrays, load_catalog
 from backend.auth import hash_password
-from backend.import_view import import_pricelist
+from backend.copy_loader import CopyStream
+from backend.filters import trigram_available
+from backend.import_view import (_facet_counts, finish_pricelist,
+                                 import_pricelist, import_pricelist_chunk,
+                                 split_pricelist, stream_stock)
 from backend.models import (Category, Client, ConfirmEmailToken, Contact,
-                            Order, Product, ProductInfo, Shop)
+                            FacetCount, ImportJob, Order, OrderItem, Parameter,
+                            PricelistUpload, Product, ProductInfo,
+                            ProductParameter, Shop, StagedProductInfo)
+from backend.storage import (delete_blob, delete_upload, load_payload,
+                             load_pricelist, save_payload, write_upload)
+from backend.tasks import (_chunk_priority, celery_fail_import_pricelist,
+                           celery_finish_import_pricelist,
+                           celery_import_pricelist,
+                           celery_import_pricelist_chunk, import_queue)
 
 
 class ProfileTests(APITestCase):
@@ -338,6 +372,21 @@ class ProfileShopTests(APITestCase):
 
 
 class ShopPricelistTests(APITestCase):
+    def setUp(self):
+        # счетчики ограничения частоты запросов общие для всех тестов
+        cache.clear()
+        # сжатые списки товаров пишутся во временный каталог,
+        # после теста в нем не должно остаться файлов
+        blob_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(blob_dir.cleanup)
+        self.blob_dir = blob_dir.name
+        blob_settings = self.settings(PRICELIST_BLOB_DIR=self.blob_dir)
+        blob_settings.enable()
+        self.addCleanup(blob_settings.disable)
+
+    def tearDown(self):
+        self.assertEqual([files for _, _, files in os.walk(self.blob_dir) if files], [])
+
     def test_get_pricelist(self):
         """
         Просмотрим список выставленных товаров
@@ -412,27 +461,1717 @@ class ShopPricelistTests(APITestCase):
         self.assertEqual(ProductInfo.objects.count(), 1)
         self.assertEqual(Category.objects.count(), 3)
 
-    def test_delete_pricelist(self):
+    def test_import_pricelist_bulk(self):
         """
-        Просмотрим список выставленных товаров
+        Загрузим список товаров пачками с общими продуктами и параметрами
+        """
+        shop = Shop.objects.create(name="MoskowShop")
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": external_id,
+                    "category": 224,
+                    "model": "apple/iphone/xs-max",
+                    "name": f"Смартфон Apple iPhone XS Max {external_id % 3}",
+                    "price": 110000 + external_id,
+                    "price_rrc": 116990,
+                    "quantity": 14,
+                    "parameters": {"Цвет": "золотистый", "Память (Гб)": 512},
+                }
+                for external_id in range(1, 8)
+            ],
+        }
+        with self.settings(PRICELIST_BATCH_SIZE=3):
+            self.assertEqual(import_pricelist(data, shop.id), True)
+            self.assertEqual(import_pricelist(data, shop.id), True)
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), 7)
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(Parameter.objects.count(), 2)
+        self.assertEqual(ProductParameter.objects.count(), 14)
+        self.assertEqual(
+            ProductParameter.objects.filter(parameter__name="Память (Гб)")[0].value,
+            "512",
+        )
+        self.assertEqual(shop.categories.get().name, "Смартфоны")
+
+    def test_import_pricelist_delta(self):
+        """
+        Повторно загрузим список товаров с изменениями и проверим, что корзины не пострадали
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+        )
+        shop = Shop.objects.create(name="MoskowShop")
+        goods = [
+            {
+                "id": external_id,
+                "category": 224,
+                "model": "apple/iphone/xs-max",
+                "name": f"Смартфон Apple iPhone XS Max {external_id}",
+                "price": 110000,
+                "price_rrc": 116990,
+                "quantity": 14,
+                "parameters": {"Цвет": "золотистый", "Память (Гб)": 512},
+            }
+            for external_id in range(1, 4)
+        ]
+        data = {"categories": [{"id": 224, "name": "Смартфоны"}], "goods": goods}
+        self.assertEqual(import_pricelist(data, shop.id), True)
+        kept = ProductInfo.objects.get(external_id=1)
+        basket = Order.objects.create(client=client, state="basket")
+        OrderItem.objects.create(order=basket, product_info=kept, quantity=2)
+
+        goods[0]["price"] = 99000
+        goods[0]["parameters"] = {"Цвет": "черный"}
+        del goods[2]
+        self.assertEqual(import_pricelist(data, shop.id), True)
+        self.assertEqual(ProductInfo.objects.get(external_id=1).id, kept.id)
+        self.assertEqual(ProductInfo.objects.get(external_id=1).price, 99000)
+        self.assertEqual(
+            list(kept.product_parameters.values_list("value", flat=True)), ["черный"]
+        )
+        self.assertEqual(ProductInfo.objects.get(external_id=3).is_active, False)
+        self.assertEqual(ProductInfo.objects.filter(is_active=True).count(), 2)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_import_pricelist_staging(self):
+        """
+        Изменения каталога публикуются целиком только после подготовки всех частей
+        """
+        Shop.objects.create(name="OtherShop")
+        shop = Shop.objects.create(name="MoskowShop")
+        goods = [
+            {
+                "id": external_id,
+                "category": 224,
+                "model": "apple/iphone/xs-max",
+                "name": "Смартфон Apple iPhone XS Max",
+                "price": 110000,
+                "price_rrc": 116990,
+                "quantity": 14,
+                "parameters": {"Цвет": "золотистый"},
+            }
+            for external_id in range(1, 4)
+        ]
+        data = {"categories": [{"id": 224, "name": "Смартфоны"}], "goods": goods}
+        self.assertEqual(import_pricelist(data, shop.id), True)
+
+        goods[0]["price"] = 99000
+        goods[1]["category"] = 15
+        with self.settings(PRICELIST_BATCH_SIZE=1):
+            self.assertEqual(
+                import_pricelist(data, shop.id),
+                {"Errors": ["goods[1].category: Категория 15 не найдена"]},
+            )
+        self.assertEqual(ProductInfo.objects.get(external_id=1).price, 110000)
+
+        goods[1]["category"] = 224
+        goods[1]["parameters"] = {"Цвет": "черный"}
+        for results in ([True, {"Errors": "Ошибка"}], [True]):
+            job = ImportJob.objects.create(shop=shop)
+            Shop.objects.filter(id=shop.id).update(
+                import_job=job, import_locked_at=timezone.now()
+            )
+            self.assertEqual(import_pricelist_chunk(goods[:2], job.id, "chunk"), True)
+            self.assertEqual(import_pricelist_chunk(goods[:2], job.id, "chunk"), True)
+            self.assertEqual(StagedProductInfo.objects.filter(job=job).count(), 2)
+            self.assertEqual(ImportJob.objects.get(id=job.id).rows_processed, 2)
+            self.assertEqual(ProductInfo.objects.get(external_id=1).price, 110000)
+            finish_pricelist(results, [1, 2], job.id)
+            self.assertEqual(StagedProductInfo.objects.count(), 0)
+            if len(results) == 2:
+                self.assertEqual(ProductInfo.objects.filter(is_active=True).count(), 3)
+        self.assertEqual(ProductInfo.objects.get(external_id=1).price, 99000)
+        self.assertEqual(
+            ProductParameter.objects.get(product_info__external_id=2).value, "черный"
+        )
+        self.assertEqual(ProductInfo.objects.get(external_id=3).is_active, False)
+
+    def test_post_pricelist_file(self):
+        """
+        Выставим список товаров файлом yaml
         """
         client = Client.objects.create(
             first_name="Andrey",
             last_name="Minin",
             username="MininAndrey1",
             email="MininComp1@gmail.com",
-            company="MininCom",
-            position="Director",
             password=hash_password("tguthguf444"),
             is_active=True,
             type="shop",
         )
         self.client.force_authenticate(client)
         Shop.objects.create(name="MoskowShop", client=client)
-        response = self.client.delete(
-            reverse("pricelist"), data={"password": "tguthguf444"}, format="json"
+        pricelist = (
+            "shop: Связной\n"
+            "goods:\n"
+            "  - id: 4216292\n"
+            "    category: 224\n"
+            "    model: apple/iphone/xs-max\n"
+            "    name: Смартфон Apple iPhone XS Max 512GB (золотистый)\n"
+            "    price: 110000\n"
+            "    price_rrc: 116990\n"
+            "    quantity: 14\n"
+            "    parameters:\n"
+            "      Цвет: золотистый\n"
+            "categories:\n"
+            "  - id: 224\n"
+            "    name: Смартфоны\n"
         )
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with tempfile.TemporaryDirectory() as upload_dir:
+            with self.settings(PRICELIST_BLOB_DIR=upload_dir):
+                response = self.client.post(
+                    reverse("pricelist"),
+                    data={
+                        "file": SimpleUploadedFile(
+                            "shop.yaml", pricelist.encode(), "application/yaml"
+                        )
+                    },
+                    format="multipart",
+                )
+            self.assertEqual(os.listdir(upload_dir), [])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(ProductInfo.objects.get().external_id, 4216292)
+        self.assertEqual(ProductParameter.objects.get().value, "золотистый")
+
+    def test_post_pricelist_csv_msgpack(self):
+        """
+        Выставим список товаров телом csv и файлом msgpack
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        Shop.objects.create(name="MoskowShop", client=client)
+        pricelist = (
+            "id;category;category_name;model;name;price;price_rrc;quantity;parameters.Цвет\n"
+            "4216292;224;Смартфоны;apple/iphone/xs-max;"
+            "Смартфон Apple iPhone XS Max;110000;116990;14;золотистый\n"
+        )
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": 4216292,
+                    "category": 224,
+                    "model": "apple/iphone/xs-max",
+                    "name": "Смартфон Apple iPhone XS Max",
+                    "price": 105000,
+                    "price_rrc": 116990,
+                    "quantity": 10,
+                    "parameters": {"Цвет": "серебристый"},
+                }
+            ],
+        }
+        with tempfile.TemporaryDirectory() as upload_dir:
+            with self.settings(PRICELIST_BLOB_DIR=upload_dir):
+                response = self.client.generic(
+                    "POST",
+                    reverse("pricelist"),
+                    pricelist.encode(),
+                    content_type="text/csv; charset=utf-8",
+                )
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+                product_info = ProductInfo.objects.get()
+                self.assertEqual(product_info.price, 110000)
+                self.assertEqual(Category.objects.get().name, "Смартфоны")
+                self.assertEqual(ProductParameter.objects.get().value, "золотистый")
+                response = self.client.post(
+                    reverse("pricelist"),
+                    data={
+                        "file": SimpleUploadedFile(
+                            "shop.msgpack", msgpack.packb(data), "application/msgpack"
+                        )
+                    },
+                    format="multipart",
+                )
+            self.assertEqual(os.listdir(upload_dir), [])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        product_info = ProductInfo.objects.get()
+        self.assertEqual((product_info.price, product_info.quantity), (105000, 10))
+        self.assertEqual(ProductParameter.objects.get().value, "серебристый")
+
+        pricelist = pricelist.replace("золотистый", "черный").encode("cp1251")
+        response = self.client.generic(
+            "POST", reverse("pricelist"), pricelist, content_type="text/csv"
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIn(
+            "Ошибка кодировки",
+            ImportJob.objects.get(id=response.json()["Job"]).errors[0],
+        )
+        response = self.client.generic(
+            "POST",
+            reverse("pricelist"),
+            pricelist,
+            content_type="text/csv; charset=windows-1251",
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(ProductParameter.objects.get().value, "черный")
+
+    def test_post_pricelist_dry_run(self):
+        """
+        Пробная загрузка показывает изменения каталога, ничего не записывая
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        shop = Shop.objects.create(name="MoskowShop", client=client)
+        goods = [
+            {
+                "id": external_id,
+                "category": 224,
+                "model": "apple/iphone",
+                "name": f"Смартфон {external_id}",
+                "price": 1000,
+                "price_rrc": 1200,
+                "quantity": 5,
+                "parameters": {"Цвет": "черный"},
+            }
+            for external_id in range(1, 5)
+        ]
+        categories = [{"id": 224, "name": "Смартфоны"}]
+        import_pricelist({"categories": categories, "goods": goods}, shop.id)
+        goods[1] = {**goods[1], "price": 900}
+        goods[2] = {**goods[2], "quantity": 3, "parameters": {"Память": "64"}}
+        goods[3] = {**goods[3], "id": 5, "name": "Смартфон 5"}
+        response = self.client.post(
+            reverse("pricelist") + "?dry_run=true",
+            data={"categories": categories, "goods": goods},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        diff = response.json()["Diff"]
+        self.assertEqual(
+            [diff[kind] for kind in ("added", "removed", "price_changed", "changed")],
+            [1, 1, 1, 1],
+        )
+        self.assertEqual(diff["unchanged"], 1)
+        self.assertEqual(
+            diff["samples"]["added"], [{"id": 5, "name": "Смартфон 5", "price": 1000}]
+        )
+        self.assertEqual(
+            diff["samples"]["removed"], [{"id": 4, "name": "Смартфон 4", "price": 1000}]
+        )
+        self.assertEqual(
+            diff["samples"]["price_changed"],
+            [{"id": 2, "name": "Смартфон 2", "price": 900, "old_price": 1000}],
+        )
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertEqual(Parameter.objects.count(), 1)
+        self.assertEqual(ProductInfo.objects.filter(is_active=True).count(), 4)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_post_pricelist_invalid(self):
+        """
+        Список товаров с ошибками отклоняется целиком со всеми ошибками,
+        которые проверка в задаче загрузки сохраняет в задании
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        Shop.objects.create(name="MoskowShop", client=client)
+        item = {
+            "id": 1,
+            "category": 224,
+            "model": "apple/iphone/xs-max",
+            "name": "Смартфон Apple iPhone XS Max",
+            "price": 110000,
+            "price_rrc": 116990,
+            "quantity": 14,
+            "parameters": {"Цвет": "золотистый"},
+        }
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}, {"id": "15"}],
+            "goods": [
+                item,
+                {**item, "price": "дорого", "category": 15},
+                {**item, "parameters": {"Цвет": ""}},
+                "товар",
+                {key: value for key, value in item.items() if key != "quantity"},
+            ],
+        }
+        response = self.client.post(reverse("pricelist"), data=data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = ImportJob.objects.get(id=response.json()["Job"])
+        self.assertEqual(job.state, "failed")
+        self.assertEqual(
+            job.errors,
+            [
+                "categories[1].id: Не указаны даннные или неверный тип данных (целое число больше 0)",
+                "categories[1].name: Не указаны даннные или неверный тип данных (строка)",
+                "goods[1].id: Повторяется ИД товара 1",
+                "goods[1].price: Неверный тип данных (целое число от 0)",
+                "goods[2].id: Повторяется ИД товара 1",
+                "goods[2].parameters.Цвет: Не указаны даннные или неверный тип данных",
+                "goods[3]: Неверный тип данных (словарь)",
+                "goods[4].quantity: Не указаны даннные",
+                "goods[4].id: Повторяется ИД товара 1",
+                "goods[1].category: Категория 15 не найдена",
+            ],
+        )
+        self.assertEqual(Category.objects.count(), 0)
+
+    def test_validate_pricelist_sections(self):
+        """
+        Файл без раздела товаров отклоняется и не снимает товары с продажи
+        """
+        shop = Shop.objects.create(name="MoskowShop")
+        categories = [{"id": 224, "name": "Смартфоны"}]
+        data = {
+            "categories": categories,
+            "goods": [
+                {
+                    "id": external_id,
+                    "category": 224,
+                    "model": "",
+                    "name": f"Смартфон {external_id}",
+                    "price": 100,
+                    "price_rrc": 100,
+                    "quantity": 1,
+                    "parameters": {},
+                }
+                for external_id in range(1, 4)
+            ],
+        }
+        self.assertEqual(import_pricelist(data, shop.id), True)
+        blob_id = save_payload({"categories": categories})
+        try:
+            self.assertEqual(
+                import_pricelist(load_pricelist(blob_id), shop.id),
+                {"Errors": ["goods: Не указаны даннные (список товаров пуст)"]},
+            )
+        finally:
+            delete_blob(blob_id)
+        self.assertEqual(
+            import_pricelist({"categories": categories}, shop.id),
+            {"Errors": ["goods: Не указаны даннные"]},
+        )
+        self.assertEqual(
+            ProductInfo.objects.filter(shop=shop, is_active=True).count(), 3
+        )
+
+    def test_post_stock(self):
+        """
+        Обновим цены и остатки без загрузки всего списка товаров
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        shop = Shop.objects.create(name="MoskowShop", client=client)
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": external_id,
+                    "category": 224,
+                    "model": "apple/iphone/xs-max",
+                    "name": "Смартфон Apple iPhone XS Max",
+                    "price": 110000,
+                    "price_rrc": 116990,
+                    "quantity": 14,
+                    "parameters": {"Цвет": "золотистый"},
+                }
+                for external_id in range(1, 5)
+            ],
+        }
+        self.assertEqual(import_pricelist(data, shop.id), True)
+        import_pricelist({**data, "goods": data["goods"][:3]}, shop.id)
+        Shop.objects.filter(id=shop.id).update(pricelist_hash="hash")
+
+        response = self.client.post(
+            reverse("stock"),
+            data={"goods": [{"external_id": 1, "price": -1}, {"quantity": 2}]},
+            format="json",
+        )
+        self.assertEqual(
+            response.json()["Errors"],
+            [
+                "goods[0].price: Неверный тип данных (целое число от 0)",
+                "goods[1].external_id: Не указаны даннные или неверный тип данных (целое число больше 0)",
+            ],
+        )
+        with self.settings(PRICELIST_SYNC_BATCH_SIZE=2):
+            response = self.client.post(
+                reverse("stock"),
+                data={
+                    "goods": [
+                        {"external_id": 1, "price": 99000, "quantity": 3},
+                        {"external_id": 2, "quantity": 0},
+                        {"external_id": 4, "price": 1},
+                        {"external_id": 7, "price": 1},
+                    ]
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {"Status": True, "Updated": 2, "Unknown": 2, "UnknownIds": [4, 7]},
+        )
+        self.assertEqual(
+            list(
+                ProductInfo.objects.order_by("external_id").values_list(
+                    "price", "quantity"
+                )
+            ),
+            [(99000, 3), (110000, 0), (110000, 14), (110000, 14)],
+        )
+        self.assertEqual(Shop.objects.get(id=shop.id).pricelist_hash, "")
+
+    def test_post_stock_stream(self):
+        """
+        Передадим обновления цен и остатков потоком NDJSON
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        shop = Shop.objects.create(name="MoskowShop", client=client)
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": external_id,
+                    "category": 224,
+                    "model": "apple/iphone/xs-max",
+                    "name": "Смартфон Apple iPhone XS Max",
+                    "price": 110000,
+                    "price_rrc": 116990,
+                    "quantity": 14,
+                    "parameters": {"Цвет": "золотистый"},
+                }
+                for external_id in range(1, 4)
+            ],
+        }
+        self.assertEqual(import_pricelist(data, shop.id), True)
+        updates = [
+            {"external_id": 1, "quantity": 5},
+            {"external_id": 1, "price": 99000},
+            {"external_id": 2, "quantity": "много"},
+            {"external_id": 3, "quantity": 0},
+            {"external_id": 9, "quantity": 1},
+        ]
+        body = "\n".join(json.dumps(update) for update in updates) + "\n{\n\n"
+        with self.settings(PRICELIST_STREAM_BATCH_SIZE=2):
+            response = self.client.post(
+                reverse("stock_stream"),
+                data=body.encode(),
+                content_type="application/x-ndjson",
+            )
+            lines = [
+                json.loads(line)
+                for line in b"".join(response.streaming_content).splitlines()
+            ]
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            lines,
+            [
+                {"rows": 4, "updated": 2, "unknown": 0},
+                {"rows": 6, "updated": 2, "unknown": 1},
+                {
+                    "Status": True,
+                    "Rows": 6,
+                    "Updated": 2,
+                    "Unknown": 1,
+                    "Errors": [
+                        "line[3].quantity: Неверный тип данных (целое число от 0)",
+                        "line[6]: Ошибка разбора JSON",
+                    ],
+                },
+            ],
+        )
+        self.assertEqual(
+            list(
+                ProductInfo.objects.order_by("external_id").values_list(
+                    "price", "quantity"
+                )
+            ),
+            [(99000, 5), (110000, 14), (110000, 0)],
+        )
+
+        # после паузы в потоке накопленные обновления применяются по сроку
+        resume = threading.Event()
+
+        def feed():
+            yield b'{"external_id": 2, "quantity": 7}\n'
+            resume.wait(5)
+            yield b'{"external_id": 2, "quantity": 8}\n'
+
+        with self.settings(PRICELIST_STREAM_FLUSH_MS=50):
+            stream = stream_stock(shop.id, feed())
+            started = time.monotonic()
+            self.assertEqual(
+                json.loads(next(stream)), {"rows": 1, "updated": 1, "unknown": 0}
+            )
+            self.assertLess(time.monotonic() - started, 4)
+            self.assertEqual(ProductInfo.objects.get(external_id=2).quantity, 7)
+            resume.set()
+            self.assertEqual(json.loads(list(stream)[-1])["Updated"], 2)
+        self.assertEqual(ProductInfo.objects.get(external_id=2).quantity, 8)
+
+    def test_pricelist_upload_parts(self):
+        """
+        Загрузим файл списка товаров по частям с продолжением после обрыва
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        Shop.objects.create(name="MoskowShop", client=client)
+        pricelist = (
+            "categories:\n"
+            "  - id: 224\n"
+            "    name: Смартфоны\n"
+            "goods:\n"
+            "  - id: 4216292\n"
+            "    category: 224\n"
+            "    model: apple/iphone/xs-max\n"
+            "    name: Смартфон Apple iPhone XS Max 512GB (золотистый)\n"
+            "    price: 110000\n"
+            "    price_rrc: 116990\n"
+            "    quantity: 14\n"
+            "    parameters:\n"
+            "      Цвет: золотистый\n"
+        ).encode()
+        size = len(pricelist)
+        with tempfile.TemporaryDirectory() as upload_dir:
+            with self.settings(PRICELIST_BLOB_DIR=upload_dir):
+                response = self.client.post(
+                    reverse("pricelist_uploads"),
+                    data={"format": "yaml", "size": size},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                url = reverse("pricelist_upload", args=[response.json()["Upload"]])
+
+                for start, end in ((0, 99), (100, 149), (200, size - 1), (0, 99)):
+                    response = self.client.put(
+                        url,
+                        data=pricelist[start : end + 1],
+                        content_type="application/octet-stream",
+                        HTTP_CONTENT_RANGE=f"bytes {start}-{end}/{size}",
+                    )
+                    if start != 200:
+                        continue
+                    self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+                    self.assertEqual(response.json()["Offset"], 150)
+                # повтор уже принятой части не обрезает файл
+                self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+                self.assertEqual(response.json()["Offset"], 150)
+                response = self.client.post(url)
+                self.assertEqual(response.json()["Error"], "Файл принят не полностью")
+
+                # тело, не совпадающее с заголовками, не меняет принятый размер
+                for content_range, data, code in (
+                    ("bytes 150-", pricelist[150:], status.HTTP_400_BAD_REQUEST),
+                    (f"bytes 150-{size - 1}/{size + 1}", pricelist[150:], 400),
+                    (f"bytes 150-{size - 1}/{size}", pricelist[150:160], 400),
+                    ("bytes 150-159/*", pricelist[150:], 400),
+                    (
+                        "",
+                        pricelist[150:] + b"\n",
+                        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    ),
+                ):
+                    response = self.client.put(
+                        url,
+                        data=data,
+                        content_type="application/octet-stream",
+                        **(
+                            {"HTTP_CONTENT_RANGE": content_range}
+                            if content_range
+                            else {}
+                        ),
+                    )
+                    self.assertEqual(response.status_code, code)
+                    self.assertIn("Error", response.json())
+                self.assertEqual(self.client.get(url).json()["Offset"], 150)
+
+                self.assertEqual(self.client.get(url).json()["Offset"], 150)
+                response = self.client.put(
+                    url,
+                    data=pricelist[150:],
+                    content_type="application/octet-stream",
+                )
+                self.assertEqual(response.json()["Offset"], size)
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+                self.assertEqual(PricelistUpload.objects.count(), 0)
+
+                # брошенная загрузка удаляется при создании новой
+                response = self.client.post(
+                    reverse("pricelist_uploads"), data={"format": "yaml"}, format="json"
+                )
+                url = reverse("pricelist_upload", args=[response.json()["Upload"]])
+                self.client.put(
+                    url, data=pricelist, content_type="application/octet-stream"
+                )
+                PricelistUpload.objects.update(
+                    updated_at=timezone.now() - datetime.timedelta(days=2)
+                )
+                self.assertEqual(
+                    self.client.get(url).status_code, status.HTTP_404_NOT_FOUND
+                )
+                self.client.post(
+                    reverse("pricelist_uploads"), data={"format": "yaml"}, format="json"
+                )
+                self.assertEqual(PricelistUpload.objects.count(), 1)
+                PricelistUpload.objects.all().delete()
+            self.assertEqual(os.listdir(os.path.join(upload_dir, "uploads")), [])
+        self.assertEqual(ProductInfo.objects.get().external_id, 4216292)
+        self.assertEqual(ProductParameter.objects.get().value, "золотистый")
+
+    def test_post_pricelist_chunks(self):
+        """
+        Выставим список товаров, загружаемый параллельными частями
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        shop = Shop.objects.create(name="MoskowShop", client=client)
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": external_id,
+                    "category": 224,
+                    "model": "apple/iphone/xs-max",
+                    "name": "Смартфон Apple iPhone XS Max",
+                    "price": 110000,
+                    "price_rrc": 116990,
+                    "quantity": 14,
+                    "parameters": {"Цвет": "золотистый"},
+                }
+                for external_id in range(1, 6)
+            ],
+        }
+        with self.settings(PRICELIST_CHUNK_SIZE=2, PRICELIST_BATCH_SIZE=1):
+            response = self.client.post(reverse("pricelist"), data=data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), 5)
+            self.assertEqual(Product.objects.count(), 1)
+            response = self.client.get(
+                reverse("pricelist_job", args=[response.json()["Job"]])
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()["state"], "done")
+            self.assertEqual(response.json()["rows_total"], 5)
+            self.assertEqual(response.json()["rows_processed"], 5)
+
+            data["goods"] = data["goods"][:3] + data["goods"][:1]
+            self.assertEqual(
+                split_pricelist(data, shop.id),
+                {"Errors": ["goods[3].id: Повторяется ИД товара 1"]},
+            )
+            data["goods"] = data["goods"][:3]
+            self.client.post(reverse("pricelist"), data=data, format="json")
+        self.assertEqual(ProductInfo.objects.filter(is_active=True).count(), 3)
+
+    def test_post_pricelist_unchanged(self):
+        """
+        Повторно выставим тот же список товаров в другом формате
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        Shop.objects.create(name="MoskowShop", client=client)
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": 4216292,
+                    "category": 224,
+                    "model": "apple/iphone/xs-max",
+                    "name": "Смартфон Apple iPhone XS Max 512GB (золотистый)",
+                    "price": 110000,
+                    "price_rrc": 116990,
+                    "quantity": 14,
+                    "parameters": {"Цвет": "золотистый"},
+                }
+            ],
+        }
+        response = self.client.post(reverse("pricelist"), data=data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.post(
+            reverse("pricelist"),
+            data={
+                "file": SimpleUploadedFile(
+                    "shop.yaml",
+                    yaml.safe_dump(data, allow_unicode=True).encode(),
+                    "application/yaml",
+                )
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["Unchanged"], True)
+        self.assertEqual(ImportJob.objects.count(), 1)
+
+        data["goods"][0]["price"] = 99000
+        response = self.client.post(reverse("pricelist"), data=data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(ImportJob.objects.count(), 2)
+
+    def test_import_lock(self):
+        """
+        Загрузки магазина выполняются по одной, ожидающая загрузка заменяется новой
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        shop = Shop.objects.create(name="MoskowShop", client=client)
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": 4216292,
+                    "category": 224,
+                    "model": "apple/iphone/xs-max",
+                    "name": "Смартфон Apple iPhone XS Max 512GB (золотистый)",
+                    "price": 110000,
+                    "price_rrc": 116990,
+                    "quantity": 14,
+                    "parameters": {"Цвет": "золотистый"},
+                }
+            ],
+        }
+        running = ImportJob.objects.create(shop=shop, state="running")
+        Shop.objects.filter(id=shop.id).update(
+            import_job=running, import_locked_at=timezone.now()
+        )
+        queued = ImportJob.objects.create(shop=shop)
+        blob_id = save_payload(data)
+        with self.assertRaises(Retry):
+            celery_import_pricelist(blob_id, queued.id, client.email)
+        self.assertEqual(ImportJob.objects.get(id=queued.id).state, "queued")
+        # отложенная задача сохраняет список товаров для повтора
+        self.assertEqual(load_payload(blob_id), data)
+        delete_blob(blob_id)
+
+        Shop.objects.filter(id=shop.id).update(import_job=None, import_locked_at=None)
+        response = self.client.post(reverse("pricelist"), data=data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(ImportJob.objects.get(id=queued.id).state, "superseded")
+        self.assertEqual(ImportJob.objects.get(id=response.json()["Job"]).state, "done")
+        self.assertEqual(Shop.objects.get(id=shop.id).import_job, None)
+
+        data["goods"][0]["price"] = 99000
+        blob_id = save_payload(data)
+        celery_import_pricelist(blob_id, queued.id, client.email)
+        self.assertEqual(ProductInfo.objects.get().price, 110000)
+        with self.assertRaises(FileNotFoundError):
+            load_payload(blob_id)
+
+        Shop.objects.filter(id=shop.id).update(
+            import_job=running,
+            import_locked_at=timezone.now() - datetime.timedelta(hours=2),
+        )
+        response = self.client.post(reverse("pricelist"), data=data, format="json")
+        self.assertEqual(ImportJob.objects.get(id=response.json()["Job"]).state, "done")
+        self.assertEqual(ProductInfo.objects.get().price, 99000)
+
+        # долгая загрузка продлевает блокировку, а потерявшая ее не публикуется
+        data["goods"][0]["price"] = 98000
+        plan = split_pricelist(data, shop.id)
+        stale = ImportJob.objects.create(shop=shop, state="running", plan=plan)
+        locked_at = timezone.now() - datetime.timedelta(minutes=50)
+        Shop.objects.filter(id=shop.id).update(
+            import_job=stale, import_locked_at=locked_at
+        )
+        celery_import_pricelist_chunk(plan["chunks"][0], stale.id)
+        self.assertGreater(Shop.objects.get(id=shop.id).import_locked_at, locked_at)
+        Shop.objects.filter(id=shop.id).update(import_job=running)
+        celery_finish_import_pricelist(
+            [True], plan["external_ids"], stale.id, client.email
+        )
+        self.assertEqual(ImportJob.objects.get(id=stale.id).state, "failed")
+        self.assertEqual(Shop.objects.get(id=shop.id).import_job, running)
+        self.assertEqual(ProductInfo.objects.get().price, 99000)
+        self.assertEqual(StagedProductInfo.objects.count(), 0)
+
+    def test_import_resume(self):
+        """
+        Повторно доставленная после сбоя загрузка продолжается с подготовленных частей
+        """
+        shop = Shop.objects.create(name="MoskowShop")
+        goods = [
+            {
+                "id": external_id,
+                "category": 224,
+                "model": "apple/iphone/xs-max",
+                "name": "Смартфон Apple iPhone XS Max",
+                "price": 110000,
+                "price_rrc": 116990,
+                "quantity": 14,
+                "parameters": {"Цвет": "золотистый"},
+            }
+            for external_id in range(1, 5)
+        ]
+        job = ImportJob.objects.create(shop=shop)
+        with self.settings(PRICELIST_CHUNK_SIZE=2):
+            plan = split_pricelist(
+                {"categories": [{"id": 224, "name": "Смартфоны"}], "goods": goods},
+                shop.id,
+            )
+        self.assertEqual(celery_import_pricelist_chunk(plan["chunks"][0], job.id), True)
+        ImportJob.objects.filter(id=job.id).update(
+            state="running", plan=plan, rows_total=plan["rows"]
+        )
+        Shop.objects.filter(id=shop.id).update(
+            import_job=job, import_locked_at=timezone.now()
+        )
+
+        celery_import_pricelist("missing.json", job.id, "MininComp1@gmail.com")
+        job = ImportJob.objects.get(id=job.id)
+        self.assertEqual(job.state, "done")
+        self.assertEqual(job.rows_processed, 4)
+        self.assertEqual(job.checkpoints.count(), 2)
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), 4)
+        self.assertEqual(StagedProductInfo.objects.count(), 0)
+
+    def test_import_failure(self):
+        """
+        Часть загрузки после сбоя повторяется с того же файла, а окончательный
+        сбой завершает загрузку с ошибкой и освобождает магазин
+        """
+        shop = Shop.objects.create(name="MoskowShop")
+        goods = [
+            {
+                "id": external_id,
+                "category": 224,
+                "model": "apple/iphone/xs-max",
+                "name": "Смартфон Apple iPhone XS Max",
+                "price": 110000,
+                "price_rrc": 116990,
+                "quantity": 14,
+                "parameters": {"Цвет": "золотистый"},
+            }
+            for external_id in range(1, 5)
+        ]
+        job = ImportJob.objects.create(shop=shop)
+        with self.settings(PRICELIST_CHUNK_SIZE=2):
+            plan = split_pricelist(
+                {"categories": [{"id": 224, "name": "Смартфоны"}], "goods": goods},
+                shop.id,
+            )
+        ImportJob.objects.filter(id=job.id).update(
+            state="running", plan=plan, rows_total=plan["rows"]
+        )
+        Shop.objects.filter(id=shop.id).update(
+            import_job=job, import_locked_at=timezone.now()
+        )
+        with mock.patch(
+            "backend.tasks.import_pricelist_chunk", side_effect=OperationalError("сбой")
+        ):
+            with self.assertRaises(OperationalError):
+                celery_import_pricelist_chunk(plan["chunks"][0], job.id)
+        # файл части сохраняется для повтора задачи
+        self.assertEqual(len(load_payload(plan["chunks"][0])), 2)
+        self.assertEqual(celery_import_pricelist_chunk(plan["chunks"][0], job.id), True)
+        self.assertEqual(StagedProductInfo.objects.count(), 2)
+        self.assertEqual(job.checkpoints.count(), 1)
+
+        celery_fail_import_pricelist(
+            None, OperationalError("сбой"), None, job.id, "MininComp1@gmail.com"
+        )
+        job = ImportJob.objects.get(id=job.id)
+        self.assertEqual(job.state, "failed")
+        self.assertEqual(len(job.errors), 1)
+        self.assertEqual(Shop.objects.get(id=shop.id).import_job, None)
+        self.assertEqual(StagedProductInfo.objects.count(), 0)
+        for blob_id in [*plan["chunks"], plan["external_ids"]]:
+            with self.assertRaises(FileNotFoundError):
+                load_payload(blob_id)
+        self.assertEqual(ProductInfo.objects.count(), 0)
+
+    def test_import_lanes(self):
+        """
+        Большой список товаров загружается в отдельной очереди
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        Shop.objects.create(name="MoskowShop", client=client)
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": 1,
+                    "category": 224,
+                    "model": "",
+                    "name": "Смартфон",
+                    "price": 100,
+                    "price_rrc": 100,
+                    "quantity": 1,
+                    "parameters": {},
+                }
+            ],
+        }
+        response = self.client.post(reverse("pricelist"), data=data, format="json")
+        self.assertEqual(ImportJob.objects.get(id=response.json()["Job"]).lane, "fast")
+        data["categories"][0]["name"] = "Телефоны"
+        with self.settings(PRICELIST_FAST_LANE_BYTES=10):
+            response = self.client.post(reverse("pricelist"), data=data, format="json")
+        response = self.client.get(
+            reverse("pricelist_job", args=[response.json()["Job"]])
+        )
+        self.assertEqual(response.json()["lane"], "bulk")
+        self.assertEqual(import_queue("bulk"), "pricelist_bulk")
+        self.assertEqual(
+            [_chunk_priority(index) for index in (0, 1, 9, 500)], [0, 1, 9, 9]
+        )
+
+    def test_import_anomalies(self):
+        """
+        Список с резкими изменениями цен задерживается до подтверждения магазином
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        shop = Shop.objects.create(name="MoskowShop", client=client)
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": external_id,
+                    "category": 224,
+                    "model": "apple/iphone",
+                    "name": f"Смартфон {external_id}",
+                    "price": 1000,
+                    "price_rrc": 1200,
+                    "quantity": 5,
+                    "parameters": {},
+                }
+                for external_id in range(1, 31)
+            ],
+        }
+        self.assertEqual(import_pricelist(data, shop.id), True)
+        for item in data["goods"][:6]:
+            item["price"] = 100000
+        for item in data["goods"][6:8]:
+            item["quantity"] = 0
+        result = import_pricelist(data, shop.id)
+        self.assertEqual(len(result["Errors"]), 1)
+        self.assertIn("у 8 из 30 товаров", result["Errors"][0])
+
+        response = self.client.post(reverse("pricelist"), data=data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = ImportJob.objects.get(id=response.json()["Job"])
+        self.assertEqual(job.state, "held")
+        self.assertEqual(
+            [job.anomalies[key] for key in ("compared", "price_jumps", "zeroed")],
+            [30, 6, 2],
+        )
+        self.assertEqual(
+            job.anomalies["samples"][0],
+            {
+                "id": 1,
+                "old_price": 1000,
+                "price": 100000,
+                "old_quantity": 5,
+                "quantity": 5,
+            },
+        )
+        self.assertFalse(ProductInfo.objects.filter(price=100000).exists())
+
+        # подтвержденная загрузка, замененная новой до запуска, удаляет свои части
+        with mock.patch("backend.views.celery_import_pricelist.apply_async") as confirm:
+            self.client.post(reverse("pricelist_job", args=[job.id]))
+        self.assertEqual(ImportJob.objects.get(id=job.id).state, "queued")
+        response = self.client.post(reverse("pricelist"), data=data, format="json")
+        celery_import_pricelist(*confirm.call_args.args[0])
+        self.assertEqual(ImportJob.objects.get(id=job.id).state, "superseded")
+        job = ImportJob.objects.get(id=response.json()["Job"])
+        self.assertEqual(job.state, "held")
+        self.assertEqual(
+            sorted(os.listdir(self.blob_dir)),
+            sorted(
+                f"{blob_id}.gz"
+                for blob_id in [*job.plan["chunks"], job.plan["external_ids"]]
+            ),
+        )
+        self.assertEqual(StagedProductInfo.objects.count(), 0)
+
+        response = self.client.post(reverse("pricelist_job", args=[job.id]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(ImportJob.objects.get(id=job.id).state, "done")
+        self.assertEqual(ProductInfo.objects.filter(price=100000).count(), 6)
+        response = self.client.post(reverse("pricelist_job", args=[job.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        data["goods"] = data["goods"][:5]
+        result = import_pricelist(data, shop.id)
+        self.assertIn("у 25 из 30 товаров", result["Errors"][0])
+        self.assertIn("нет в новом списке у 25", result["Errors"][0])
+        self.assertEqual(
+            ProductInfo.objects.filter(shop=shop, is_active=True).count(), 30
+        )
+        report = find_anomalies(load_catalog(shop.id), goods_arrays([]), 0.2)
+        self.assertEqual([report["removed"], report["held"]], [30, True])
+
+        Shop.objects.filter(id=shop.id).update(anomaly_threshold=None)
+        for item in data["goods"]:
+            item["price"] = 1
+        self.assertEqual(import_pricelist(data, shop.id), True)
+
+    def test_import_pricelists_command(self):
+        """
+        Загрузим списки товаров нескольких магазинов из каталога командой
+        """
+        shop = Shop.objects.create(name="MoskowShop")
+        other_shop = Shop.objects.create(name="Связной")
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, f"{shop.id}.yaml"), "w") as file:
+                yaml.dump(
+                    {
+                        "categories": [{"id": 224, "name": "Смартфоны"}],
+                        "goods": [
+                            {
+                                "id": 1,
+                                "category": 224,
+                                "model": "apple/iphone",
+                                "name": "Смартфон Apple iPhone",
+                                "price": 1000,
+                                "price_rrc": 1200,
+                                "quantity": 5,
+                                "parameters": {},
+                            }
+                        ],
+                    },
+                    file,
+                    allow_unicode=True,
+                )
+            with open(os.path.join(directory, "supplier.csv"), "w") as file:
+                file.write(
+                    "id;category;category_name;model;name;price;price_rrc;quantity\n"
+                    "1;224;Смартфоны;apple/iphone;Смартфон Apple iPhone;900;1200;3\n"
+                    "2;224;Смартфоны;apple/ipad;Планшет Apple iPad;700;800;4\n"
+                )
+            with open(os.path.join(directory, "broken.json"), "w") as file:
+                file.write('{"categories": [], "goods": [{"id": "1"}]}')
+            mapping = os.path.join(directory, "mapping")
+            with open(mapping, "w") as file:
+                json.dump({"supplier.csv": "Связной", "broken.json": shop.id}, file)
+            queued = ImportJob.objects.create(shop=shop)
+            out = io.StringIO()
+            with self.assertRaisesMessage(CommandError, "Не загружено файлов: 1 из 3"):
+                call_command(
+                    "import_pricelists",
+                    directory,
+                    mapping=mapping,
+                    processes=1,
+                    stdout=out,
+                )
+            # команда держит блокировку магазина, как загрузка через Celery
+            self.assertEqual(ImportJob.objects.get(id=queued.id).state, "superseded")
+            self.assertEqual(
+                list(
+                    ImportJob.objects.exclude(id=queued.id)
+                    .order_by("shop_id")
+                    .values_list("shop", "state", "rows_total")
+                ),
+                [(shop.id, "done", 1), (other_shop.id, "done", 2)],
+            )
+            running = ImportJob.objects.create(shop=shop, state="running")
+            Shop.objects.filter(id=shop.id).update(
+                import_job=running, import_locked_at=timezone.now()
+            )
+            locked = io.StringIO()
+            with self.assertRaisesMessage(CommandError, "Не загружено файлов: 2 из 3"):
+                call_command(
+                    "import_pricelists",
+                    directory,
+                    mapping=mapping,
+                    processes=1,
+                    stdout=locked,
+                )
+            self.assertIn(
+                "Магазин уже загружает другой список товаров",
+                locked.getvalue().splitlines()[1],
+            )
+            self.assertEqual(Shop.objects.get(id=shop.id).import_job, running)
+        summary = out.getvalue().splitlines()
+        self.assertEqual(
+            summary[0].split(), ["Файл", "Магазин", "Товаров", "Время,", "с", "Ошибка"]
+        )
+        self.assertEqual(summary[1].split()[:3], [f"{shop.id}.yaml", str(shop.id), "1"])
+        self.assertIn("Для магазина уже указан другой файл", summary[2])
+        self.assertEqual(
+            summary[3].split()[:3], ["supplier.csv", str(other_shop.id), "2"]
+        )
+        self.assertTrue(summary[4].startswith("Загружено файлов: 2 из 3, товаров: 3"))
+        self.assertEqual(
+            list(
+                ProductInfo.objects.order_by("shop_id", "external_id").values_list(
+                    "shop", "price"
+                )
+            ),
+            [(shop.id, 1000), (other_shop.id, 900), (other_shop.id, 700)],
+        )
+
+    def test_pricelist_blob(self):
+        """
+        Сохраним список товаров в хранилище в сжатом виде и прочитаем его обратно
+        """
+        data = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {"id": external_id, "name": "Смартфон"} for external_id in range(100)
+            ],
+        }
+        with tempfile.TemporaryDirectory() as blob_dir:
+            with self.settings(PRICELIST_BLOB_DIR=blob_dir):
+                blob_id = save_payload(data)
+                path = os.path.join(blob_dir, os.listdir(blob_dir)[0])
+                self.assertLess(os.path.getsize(path), len(json.dumps(data)) / 5)
+                pricelist = load_pricelist(blob_id)
+                self.assertEqual(list(pricelist["goods"]), data["goods"])
+                self.assertEqual(list(pricelist["categories"]), data["categories"])
+                delete_blob(blob_id)
+                # часть файла загрузки читается не дальше допустимого размера
+                stream = io.BytesIO(b"x" * 10)
+                self.assertEqual(write_upload(blob_id, 0, stream, 4), 5)
+                self.assertEqual(stream.tell(), 5)
+                delete_upload(blob_id)
+            self.assertEqual([files for _, _, files in os.walk(blob_dir) if files], [])
+
+    def test_copy_stream(self):
+        """
+        Проверим формирование строк COPY: спецсимволы экранируются, None передается как NULL
+        """
+        stream = CopyStream(
+            [[1, None, "Модель\tс\\табом\n", [[2, "64 ГБ"]]], [2, 3, "", None]]
+        )
+        data = ""
+        while chunk := stream.read(7):
+            data += chunk
+        self.assertEqual(
+            data,
+            '1\t\\N\tМодель\\tс\\\\табом\\n\t[[2, "64 ГБ"]]\n2\t3\t\t\\N\n',
+        )
+
+    def test_delete_pricelist(self):
+        """
+        Просмотрим список выставленных товаров
+        """
+        client = Client.objects.create(
+            first_name="Andrey",
+            last_name="Minin",
+            username="MininAndrey1",
+            email="MininComp1@gmail.com",
+            company="MininCom",
+            position="Director",
+            password=hash_password("tguthguf444"),
+            is_active=True,
+            type="shop",
+        )
+        self.client.force_authenticate(client)
+        Shop.objects.create(name="MoskowShop", client=client)
+        response = self.client.delete(
+            reverse("pricelist"), data={"password": "tguthguf444"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "параллельная запись требует PostgreSQL"
+)
+class ParallelImportTests(APITransactionTestCase):
+    def test_import_shared_references(self):
+        """
+        Одновременные загрузки двух магазинов с одними и теми же новыми
+        категориями, продуктами и параметрами не создают дублей
+        """
+        shops = [Shop.objects.create(name=f"Shop{index}") for index in range(2)]
+        data = {
+            "categories": [
+                {"id": category_id, "name": f"Категория {category_id}"}
+                for category_id in range(500, 505)
+            ],
+            "goods": [
+                {
+                    "id": external_id,
+                    "category": 500 + external_id % 5,
+                    "model": "",
+                    "name": f"Товар {external_id}",
+                    "price": 100,
+                    "price_rrc": 100,
+                    "quantity": 1,
+                    "parameters": {f"Параметр {external_id % 7}": "1"},
+                }
+                for external_id in range(1, 301)
+            ],
+        }
+        start, results = threading.Barrier(len(shops)), {}
+
+        def run(shop):
+            try:
+                start.wait()
+                results[shop.id] = import_pricelist(data, shop.id)
+            finally:
+                connection.close()
+
+        with self.settings(PRICELIST_BATCH_SIZE=20):
+            threads = [threading.Thread(target=run, args=[shop]) for shop in shops]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(list(results.values()), [True, True])
+        self.assertEqual(Category.objects.count(), 5)
+        self.assertEqual(Product.objects.count(), 300)
+        self.assertEqual(Parameter.objects.count(), 7)
+        self.assertEqual(ProductInfo.objects.count(), 600)
+
+
+class ProductsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for shop_index in range(2):
+            shop = Shop.objects.create(name=f"Shop{shop_index}")
+            import_pricelist(
+                {
+                    "categories": [
+                        {"id": 224, "name": "Смартфоны"},
+                        {"id": 15, "name": "Аксессуары"},
+                    ],
+                    "goods": [
+                        {
+                            "id": external_id,
+                            "category": 224 if external_id % 2 else 15,
+                            "model": "apple/iphone",
+                            "name": f"Товар {external_id}",
+                            "price": 1000 + external_id,
+                            "price_rrc": 1200,
+                            "quantity": 5,
+                            "parameters": {"Цвет": "черный", "Память": external_id},
+                        }
+                        for external_id in range(1, 11)
+                    ],
+                },
+                shop.id,
+            )
+
+    def test_get_products(self):
+        """
+        Список товаров загружается фиксированным числом запросов
+        """
+        url = reverse("productinfo-list")
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {"limit": 5})
+        self.assertEqual(len(response.json()["results"]), 5)
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {"limit": 20})
+        results = response.json()["results"]
+        self.assertEqual(len(results), 20)
+        self.assertEqual(
+            {result["product"]["category"]["name"] for result in results},
+            {"Смартфоны", "Аксессуары"},
+        )
+        self.assertEqual(
+            sorted(
+                parameter["parameter"] for parameter in results[0]["product_parameters"]
+            ),
+            ["Память", "Цвет"],
+        )
+        with self.assertNumQueries(3):
+            self.client.get(url, {"limit": 20, "search": "черный"})
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("productinfo-detail", args=[results[0]["id"]])
+            )
+        self.assertEqual(response.json()["shop"]["name"], results[0]["shop"]["name"])
+
+    def test_get_products_cursor(self):
+        """
+        Обойдем каталог постранично по курсору без подсчета записей
+        """
+        url = reverse("productinfo-list")
+        response = self.client.get(url, {"limit": 7})
+        self.assertEqual(response.json()["count"], 20)
+        ids, pages = [], 0
+        params = {"pagination": "cursor", "limit": 7}
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url, params)
+            page = response.json()
+            self.assertNotIn("count", page)
+            ids.extend(result["id"] for result in page["results"])
+            url, params, pages = page["next"], None, pages + 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(
+            ids, list(ProductInfo.objects.order_by("id").values_list("id", flat=True))
+        )
+        response = self.client.get(
+            reverse("productinfo-list"),
+            {"pagination": "cursor", "ordering": "price", "limit": 20},
+        )
+        prices = [result["price"] for result in response.json()["results"]]
+        self.assertEqual(prices, sorted(prices))
+        response = self.client.get(
+            reverse("category-list"), {"pagination": "cursor", "limit": 1}
+        )
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertIsNotNone(response.json()["next"])
+        # подделанный или поврежденный курсор не приводит к ошибке сервера
+        cache.clear()
+        for position in (["дорого", 1], [None, 1], [100, [1]], [100], "1"):
+            cursor = base64.b64encode(
+                urlencode({"p": json.dumps(position)}).encode()
+            ).decode()
+            response = self.client.get(
+                reverse("productinfo-list"), {"cursor": cursor, "ordering": "price"}
+            )
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(response.json()["detail"], "Invalid cursor")
+        response = self.client.get(reverse("productinfo-list"), {"cursor": "не курсор"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_products_cursor_same_price(self):
+        """
+        Обход по курсору с сортировкой по цене, когда у большинства товаров одна цена
+        """
+        shop = Shop.objects.create(name="Shop2")
+        product = Product.objects.get(name="Товар 1")
+        ProductInfo.objects.bulk_create(
+            ProductInfo(
+                product=product,
+                shop=shop,
+                external_id=external_id,
+                model="",
+                quantity=1,
+                price=900,
+                price_rrc=900,
+            )
+            for external_id in range(1, 1101)
+        )
+        url, params, ids, pages = (
+            reverse("productinfo-list"),
+            {"pagination": "cursor", "ordering": "price", "limit": 100},
+            [],
+            [],
+        )
+        while url:
+            # страниц больше, чем разрешено анонимных запросов в минуту
+            cache.clear()
+            with self.assertNumQueries(2):
+                response = self.client.get(url, params)
+            page = response.json()
+            pages.append(page)
+            ids.extend(result["id"] for result in page["results"])
+            url, params = page["next"], None
+        self.assertEqual(len(pages), 12)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(
+            ids,
+            list(
+                ProductInfo.objects.filter(is_active=True)
+                .order_by("price", "id")
+                .values_list("id", flat=True)
+            ),
+        )
+        response = self.client.get(pages[6]["previous"])
+        self.assertEqual(response.json()["results"], pages[5]["results"])
+
+    def test_search_products(self):
+        """
+        Поиск товаров: совпадения в названии выше совпадений в параметрах,
+        поисковые векторы обновляются при загрузке
+        """
+        shop = Shop.objects.create(name="Shop2")
+        item = {
+            "category": 7,
+            "model": "case",
+            "price": 500,
+            "price_rrc": 600,
+            "quantity": 5,
+        }
+        data = {
+            "categories": [{"id": 7, "name": "Чехлы"}],
+            "goods": [
+                {
+                    **item,
+                    "id": 1,
+                    "name": "Чехол для смартфона",
+                    "parameters": {"Цвет": "красный"},
+                },
+                {
+                    **item,
+                    "id": 2,
+                    "name": "Красный смартфон Apple",
+                    "parameters": {"Цвет": "черный"},
+                },
+                {**item, "id": 3, "name": "Чехол", "parameters": {}},
+            ],
+        }
+        import_pricelist(data, shop.id)
+        url = reverse("productinfo-list")
+
+        def search(text):
+            response = self.client.get(url, {"search": text})
+            return [
+                result["external_id"]
+                for result in response.json()["results"]
+                if result["shop"]["id"] == shop.id
+            ]
+
+        self.assertEqual(sorted(search("смартфон")), [1, 2])
+        if connection.vendor == "postgresql":
+            self.assertEqual(search("красные смартфоны"), [2, 1])
+            data["goods"][0]["parameters"]["Цвет"] = "синий"
+            import_pricelist(data, shop.id)
+            self.assertEqual(search("красные смартфоны"), [2])
+            self.assertEqual(search("чехлы синие"), [1])
+
+    def test_suggest(self):
+        """
+        Подсказки по названиям продуктов на продаже и категорий
+        """
+        ProductInfo.objects.filter(product__name="Товар 10").update(is_active=False)
+        url = reverse("suggest")
+        response = self.client.get(url, {"q": "Товар 1"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        products = response.json()["products"]
+        self.assertEqual(products[0]["name"], "Товар 1")
+        self.assertEqual(
+            products[0]["category"], Product.objects.get(name="Товар 1").category_id
+        )
+        self.assertNotIn("Товар 10", [product["name"] for product in products])
+        self.assertTrue(0 < products[0]["similarity"] <= 1)
+        response = self.client.get(url, {"q": "Смартф", "limit": 1})
+        self.assertEqual(
+            [category["name"] for category in response.json()["categories"]],
+            ["Смартфоны"],
+        )
+        if trigram_available(connection.alias):
+            response = self.client.get(url, {"q": "Смартфнон"})
+            self.assertEqual(response.json()["categories"][0]["name"], "Смартфоны")
+        response = self.client.get(url, {"q": "Т"})
+        self.assertEqual(response.json(), {"products": [], "categories": []})
+        response = self.client.get(url, {"q": "Товар", "limit": 0})
+        self.assertEqual(response.json()["Status"], False)
+
+    def test_product_facets(self):
+        """
+        Отбор товаров по значениям параметров и счетчики значений,
+        обновляемые при загрузке списка товаров
+        """
+
+        def stored_counts():
+            return {
+                (row.shop_id, row.category_id, row.parameter_id, row.value): row.count
+                for row in FacetCount.objects.all()
+            }
+
+        def actual_counts():
+            return {
+                key[:-1]: key[-1]
+                for key in ProductParameter.objects.filter(product_info__is_active=True)
+                .values_list(
+                    "product_info__shop",
+                    "product_info__product__category",
+                    "parameter",
+                    "value",
+                )
+                .annotate(count=Count("id"))
+                .order_by()
+            }
+
+        url = reverse("productinfo-list")
+        category = Category.objects.get(name="Смартфоны").id
+        response = self.client.get(
+            url, {"category": category, "parameter": ["Память:1", "Память:3"]}
+        )
+        self.assertEqual(response.json()["count"], 4)
+        self.assertNotIn("facets", response.json())
+        response = self.client.get(
+            url, {"parameter": ["Память:1", "Память:2", "Цвет:черный"]}
+        )
+        self.assertEqual(response.json()["count"], 4)
+        response = self.client.get(url, {"parameter": ["Память:1", "Цвет:белый"]})
+        self.assertEqual(response.json()["count"], 0)
+
+        response = self.client.get(url, {"category": category, "facets": "true"})
+        self.assertEqual(response.json()["count"], 10)
+        facets = {
+            facet["parameter"]: {
+                value["value"]: value["count"] for value in facet["values"]
+            }
+            for facet in response.json()["facets"]
+        }
+        self.assertEqual(
+            facets,
+            {
+                "Память": {"1": 2, "3": 2, "5": 2, "7": 2, "9": 2},
+                "Цвет": {"черный": 10},
+            },
+        )
+        shop = Shop.objects.get(name="Shop0")
+        import_pricelist(
+            {
+                "categories": [{"id": 224, "name": "Смартфоны"}],
+                "goods": [
+                    {
+                        "id": external_id,
+                        "category": 224,
+                        "model": "apple/iphone",
+                        "name": f"Товар {external_id}",
+                        "price": 1000,
+                        "price_rrc": 1200,
+                        "quantity": 5,
+                        "parameters": {
+                            "Цвет": "белый" if external_id == 1 else "черный"
+                        },
+                    }
+                    for external_id in (1, 3)
+                ],
+            },
+            shop.id,
+        )
+        response = self.client.get(
+            url,
+            {
+                "category": category,
+                "facets": "true",
+                "pagination": "cursor",
+                "limit": 20,
+            },
+        )
+        self.assertEqual(len(response.json()["results"]), 7)
+        self.assertEqual(
+            response.json()["facets"][1],
+            {
+                "parameter": "Цвет",
+                "values": [
+                    {"value": "черный", "count": 6},
+                    {"value": "белый", "count": 1},
+                ],
+            },
+        )
+        response = self.client.get(url, {"facets": "true"})
+        self.assertEqual(
+            response.json()["facets"][0]["values"][0], {"value": "1", "count": 1}
+        )
+        response = self.client.get(url, {"category": "все", "facets": "true"})
+        self.assertEqual(response.json()["facets"], [])
+        self.assertEqual(stored_counts(), actual_counts())
+
+        catalog = {
+            "categories": [{"id": 224, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": 1,
+                    "category": 224,
+                    "model": "apple/iphone",
+                    "name": "Товар 1",
+                    "price": 900,
+                    "price_rrc": 1200,
+                    "quantity": 5,
+                    "parameters": {"Цвет": "белый"},
+                }
+            ],
+        }
+        with mock.patch(
+            "backend.import_view._facet_counts", wraps=_facet_counts
+        ) as counts:
+            import_pricelist(catalog, shop.id)
+        self.assertEqual(stored_counts(), actual_counts())
+        if connection.vendor != "postgresql":
+            # товар 1 изменился только ценой, пересчитывается лишь снятый товар 3
+            self.assertEqual(
+                [call.args[0] for call in counts.call_args_list if call.args[0]],
+                [[ProductInfo.objects.get(shop=shop, external_id=3).id]],
+            )
+        facets = {
+            facet["parameter"]: {
+                value["value"]: value["count"] for value in facet["values"]
+            }
+            for facet in self.client.get(
+                url, {"category": category, "facets": "true"}
+            ).json()["facets"]
+        }
+        self.assertEqual(facets["Цвет"], {"черный": 5, "белый": 1})
 
 
 class BasketTests(APITestCase):
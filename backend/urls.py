@@ -1,10 +1,15 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from backend.views import CategoryView, ProductsViewSet, ShopView
+from backend.views import (CategoryView, ProductSuggestView, ProductsViewSet,
+                           ShopView)
 
 router = DefaultRouter()
 router.register("all", ProductsViewSet)
 router.register("category/all", CategoryView)
 router.register("shop/all", ShopView)
 
-urlpatterns = router.urls
+urlpatterns = [
+    path("suggest/", ProductSuggestView.as_view(), name="suggest"),
+    *router.urls,
+]
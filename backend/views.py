@@ -1,27 +1,48 @@
 import datetime
+import re
+import uuid
 
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db import IntegrityError
-from django.db.models import F, Q, Sum
-from drf_spectacular.utils import (OpenApiExample, OpenApiResponse,
-                                   extend_schema, extend_schema_view)
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from drf_spectacular.utils import (OpenApiExample, OpenApiParameter,
+                                   OpenApiResponse, extend_schema,
+                                   extend_schema_view)
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import api_view
-from rest_framework.filters import SearchFilter
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
 from backend.auth import check_password, generate_password, hash_password
+from backend.filters import (ProductFacetFilter, ProductSearchFilter,
+                             facet_counts, suggest_names)
+from backend.import_view import (MAX_VALIDATION_ERRORS, diff_pricelist,
+                                 stream_stock, sync_stock, validate_stock)
 from backend.models import (Category, Client, ConfirmEmailToken, Contact,
-                            Order, OrderItem, ProductInfo, Shop)
+                            FacetCount, ImportJob, Order, OrderItem,
+                            PricelistUpload, Product, ProductInfo, Shop)
+from backend.pagination import OptionalCursorPagination
+from backend.parsers import (PRICELIST_CONTENT_TYPES, READERS,
+                             PricelistFormatError, detect_format,
+                             pricelist_hash)
 from backend.serializers import (CategorySerializer, ClientSerializer,
-                                 ContactsSerializer, OrderItemSerializer,
-                                 OrderSerializer, ProductInfoSerializer,
-                                 ShopAllSerializer, ShopSerializer)
-from backend.tasks import celery_import_pricelist, celery_send_note
+                                 ContactsSerializer, ImportJobSerializer,
+                                 OrderItemSerializer, OrderSerializer,
+                                 ProductInfoSerializer, ShopAllSerializer,
+                                 ShopSerializer)
+from backend.storage import (blob_size, delete_blob, delete_upload,
+                             load_pricelist, save_payload, save_stream,
+                             save_upload, save_upload_part, truncate_upload,
+                             write_upload)
+from backend.tasks import (celery_import_pricelist, celery_send_note,
+                           discard_import_plan, import_queue,
+                           supersede_imports)
 
 
 @extend_schema(tags=["Профиль пользователя сервиса"])
@@ -787,6 +808,68 @@ def state_change_view(request, *args, **kwargs):
     )
 
 
+def enqueue_pricelist(blob_id, shop, email, dry_run=False):
+    """
+    Создать задание загрузки и отправить список товаров в очередь.
+    Список проверяется один раз в задаче загрузки, ошибки сохраняются
+    в ImportJob.errors. Запрос читает файл только для подсчета хэша.
+    При dry_run список не загружается: сразу возвращаются изменения каталога.
+    Ожидающие в очереди и задержанные загрузки магазина заменяются новой.
+    Большие списки отправляются в отдельную очередь, чтобы не задерживать небольшие.
+    Если список совпадает с последним успешно загруженным и других загрузок нет,
+    задание не создается
+    """
+
+    if dry_run:
+        diff = diff_pricelist(load_pricelist(blob_id), shop.id)
+        delete_blob(blob_id)
+        if "Errors" in diff:
+            return Response({"Status": False, **diff}, status=200)
+        return Response({"Status": True, "Diff": diff}, status=200)
+    try:
+        content_hash = pricelist_hash(load_pricelist(blob_id))
+    except (PricelistFormatError, KeyError):
+        # ошибку формата подробно опишет проверка в задаче загрузки
+        content_hash = ""
+    pending = ImportJob.objects.filter(shop=shop, state__in=("queued", "running"))
+    if (
+        shop.pricelist_hash
+        and content_hash == shop.pricelist_hash
+        and not pending.exists()
+    ):
+        delete_blob(blob_id)
+        return Response(
+            {
+                "Status": True,
+                "Info": "Список товаров не изменился с последней загрузки. Загрузка не требуется",
+                "Unchanged": True,
+            },
+            status=200,
+        )
+    supersede_imports(shop.id)
+    job = ImportJob.objects.create(
+        shop=shop,
+        task_id=str(uuid.uuid4()),
+        content_hash=content_hash,
+        lane="fast"
+        if blob_size(blob_id) <= settings.PRICELIST_FAST_LANE_BYTES
+        else "bulk",
+    )
+    celery_import_pricelist.apply_async(
+        (blob_id, job.id, email),
+        task_id=job.task_id,
+        queue=import_queue(job.lane),
+    )
+    return Response(
+        {
+            "Status": True,
+            "Info": "Список товаров отправлен на загрузку. Ожидайте сообщения на электронную почту",
+            "Job": job.id,
+        },
+        status=202,
+    )
+
+
 @extend_schema(tags=["Профиль магазина"])
 @extend_schema_view(
     get=extend_schema(
@@ -795,7 +878,17 @@ def state_change_view(request, *args, **kwargs):
     ),
     post=extend_schema(
         summary="Загрузка списка товаров",
-        description="Для загрузки списка товаров профиля магазина пользователя сервиса",
+        description="Для загрузки списка товаров профиля магазина пользователя сервиса. "
+        "Большие списки можно передать файлом (json, yaml, csv, msgpack) в поле 'file' multipart-запроса "
+        "или телом запроса с соответствующим Content-Type (application/yaml, text/csv, application/msgpack). "
+        "Текстовые форматы - в UTF-8 или в кодировке из charset Content-Type (text/csv; charset=windows-1251). "
+        "С параметром dry_run=true список не загружается, а возвращаются изменения каталога: "
+        "число добавляемых, снимаемых с продажи и изменивших цену товаров и примеры каждого вида",
+        parameters=[
+            OpenApiParameter(
+                "dry_run", bool, description="Только показать изменения каталога"
+            )
+        ],
     ),
     delete=extend_schema(
         summary="Удаление списка товаров",
@@ -812,7 +905,9 @@ class ShopPricelist(APIView):
             if request.user.type == "shop":
                 shop = Shop.objects.get(client=request.user.id)
                 if shop.state == True:
-                    product_all = ProductInfo.objects.filter(shop=shop.id)
+                    product_all = ProductInfoSerializer.setup_eager_loading(
+                        ProductInfo.objects.filter(shop=shop.id, is_active=True)
+                    )
                     if product_all:
                         serializer = ProductInfoSerializer(product_all, many=True)
                         return Response(serializer.data)
@@ -839,20 +934,55 @@ class ShopPricelist(APIView):
                 if request.user.is_active == True:
                     shop = Shop.objects.get(client=request.user.id)
                     if shop.state == True:
+                        dry_run = request.query_params.get("dry_run") in ("1", "true")
+                        body_format = PRICELIST_CONTENT_TYPES.get(
+                            request.content_type.split(";")[0].strip()
+                        )
+                        if body_format and body_format != "json":
+                            if request.stream:
+                                return enqueue_pricelist(
+                                    save_stream(
+                                        request.stream, body_format, request.encoding
+                                    ),
+                                    shop,
+                                    request.user.email,
+                                    dry_run,
+                                )
+                            return Response(
+                                {
+                                    "Status": False,
+                                    "Errors": "Не указаны все необходимые данные",
+                                },
+                                status=200,
+                            )
+                        if "file" in request.FILES:
+                            pricelist_format = detect_format(request.FILES["file"])
+                            if pricelist_format:
+                                return enqueue_pricelist(
+                                    save_upload(
+                                        request.FILES["file"], pricelist_format
+                                    ),
+                                    shop,
+                                    request.user.email,
+                                    dry_run,
+                                )
+                            return Response(
+                                {
+                                    "Status": False,
+                                    "Errors": "Неподдерживаемый формат файла (json, yaml, csv, msgpack)",
+                                },
+                                status=200,
+                            )
                         if {"categories", "goods"}.issubset(request.data):
                             if (
                                 type(request.data["categories"]) == list
                                 and type(request.data["goods"]) == list
                             ):
-                                celery_import_pricelist.delay(
-                                    request.data, shop.id, request.user.email
-                                )
-                                return Response(
-                                    {
-                                        "Status": True,
-                                        "Info": "Список товаров отправлен на загрузку. Ожидайте сообщения на электронную почту",
-                                    },
-                                    status=202,
+                                return enqueue_pricelist(
+                                    save_payload(request.data),
+                                    shop,
+                                    request.user.email,
+                                    dry_run,
                                 )
                             return Response(
                                 {
@@ -899,6 +1029,8 @@ class ShopPricelist(APIView):
                         ):
                             shop = Shop.objects.get(client=request.user.id)
                             ProductInfo.objects.filter(shop=shop).delete()
+                            FacetCount.objects.filter(shop=shop).delete()
+                            Shop.objects.filter(id=shop.id).update(pricelist_hash="")
                             return Response(
                                 {"Status": True, "Info": "Список товаров удален"},
                                 status=204,
@@ -928,11 +1060,493 @@ class ShopPricelist(APIView):
         )
 
 
+@extend_schema(
+    tags=["Профиль магазина"],
+    summary="Обновление цен и остатков",
+    description="Для быстрого обновления цен и остатков выставленных товаров без полной загрузки списка товаров. "
+    "Принимает список 'goods' из элементов {external_id, price, quantity}",
+)
+class ShopStock(APIView):
+    """
+    Класс для обновления цен и остатков списка товаров профиля магазина
+    """
+
+    def post(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                if request.user.is_active == True:
+                    shop = Shop.objects.get(client=request.user.id)
+                    if shop.state == True:
+                        if {"goods"}.issubset(request.data) and type(
+                            request.data["goods"]
+                        ) == list:
+                            errors = validate_stock(request.data["goods"])
+                            if errors:
+                                return Response(
+                                    {"Status": False, "Errors": errors}, status=200
+                                )
+                            result = sync_stock(shop.id, request.data["goods"])
+                            return Response(
+                                {
+                                    "Status": True,
+                                    "Updated": result["updated"],
+                                    "Unknown": len(result["unknown"]),
+                                    "UnknownIds": result["unknown"][
+                                        :MAX_VALIDATION_ERRORS
+                                    ],
+                                },
+                                status=200,
+                            )
+                        return Response(
+                            {
+                                "Status": False,
+                                "Errors": "Не указаны все необходимые данные (goods)",
+                            },
+                            status=200,
+                        )
+                    return Response(
+                        {
+                            "Status": False,
+                            "Error": "Только для магазинов с активным статусом",
+                        },
+                        status=200,
+                    )
+                return Response(
+                    {
+                        "Status": False,
+                        "Error": "Необходимо сначала подтвердить адрес электронной почты",
+                    },
+                    status=200,
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+
+@extend_schema(
+    tags=["Профиль магазина"],
+    summary="Потоковое обновление цен и остатков",
+    description="Для непрерывной передачи обновлений цен и остатков одним запросом в формате NDJSON "
+    "(application/x-ndjson): по одному {external_id, price, quantity} на строку. "
+    "Обновления применяются пачками, в ответе построчно передается ход обработки и итог",
+)
+class ShopStockStream(APIView):
+    """
+    Класс для потокового обновления цен и остатков списка товаров профиля магазина
+    """
+
+    def post(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                if request.user.is_active == True:
+                    shop = Shop.objects.get(client=request.user.id)
+                    if shop.state == True:
+                        return StreamingHttpResponse(
+                            stream_stock(shop.id, request._request),
+                            content_type="application/x-ndjson",
+                        )
+                    return Response(
+                        {
+                            "Status": False,
+                            "Error": "Только для магазинов с активным статусом",
+                        },
+                        status=200,
+                    )
+                return Response(
+                    {
+                        "Status": False,
+                        "Error": "Необходимо сначала подтвердить адрес электронной почты",
+                    },
+                    status=200,
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+def upload_expired_before():
+    return timezone.now() - datetime.timedelta(seconds=settings.PRICELIST_UPLOAD_EXPIRE)
+
+
+def delete_expired_uploads():
+    """
+    Удалить загрузки по частям без новых частей дольше PRICELIST_UPLOAD_EXPIRE
+    вместе с принятыми частями файлов
+    """
+
+    expired = PricelistUpload.objects.filter(updated_at__lt=upload_expired_before())
+    for upload_id in expired.values_list("id", flat=True):
+        delete_upload(upload_id)
+    expired.delete()
+
+
+@extend_schema(
+    tags=["Профиль магазина"],
+    summary="Начало загрузки файла списка товаров по частям",
+    description="Для загрузки больших файлов списка товаров по ненадежному соединению. "
+    "Принимает формат файла 'format' (json, yaml, csv, msgpack) и размер 'size' в байтах, возвращает номер загрузки. "
+    "Части передаются запросами PUT на адрес загрузки с заголовком Content-Range, "
+    "после обрыва передача продолжается со смещения из GET, POST на адрес загрузки завершает ее. "
+    "Загрузка без новых частей удаляется через сутки",
+)
+class PricelistUploadView(APIView):
+    """
+    Класс для создания загрузок файла списка товаров по частям
+    """
+
+    def post(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                if request.user.is_active == True:
+                    shop = Shop.objects.get(client=request.user.id)
+                    if shop.state == True:
+                        delete_expired_uploads()
+                        size = request.data.get("size")
+                        if request.data.get("format") in READERS and (
+                            size is None
+                            or type(size) == int
+                            and 0 < size <= settings.PRICELIST_UPLOAD_MAX_BYTES
+                        ):
+                            upload = PricelistUpload.objects.create(
+                                shop=shop, format=request.data["format"], size=size
+                            )
+                            return Response(
+                                {"Status": True, "Upload": upload.id, "Offset": 0},
+                                status=201,
+                            )
+                        return Response(
+                            {
+                                "Status": False,
+                                "Errors": "Не указаны все необходимые данные или неверный тип данных (format, size)",
+                            },
+                            status=200,
+                        )
+                    return Response(
+                        {
+                            "Status": False,
+                            "Error": "Только для магазинов с активным статусом",
+                        },
+                        status=200,
+                    )
+                return Response(
+                    {
+                        "Status": False,
+                        "Error": "Необходимо сначала подтвердить адрес электронной почты",
+                    },
+                    status=200,
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+
+@extend_schema(tags=["Профиль магазина"])
+@extend_schema_view(
+    get=extend_schema(
+        summary="Смещение загрузки файла списка товаров",
+        description="Для продолжения прерванной загрузки: сколько байт файла уже принято",
+    ),
+    put=extend_schema(
+        summary="Передача части файла списка товаров",
+        description="Тело запроса - байты файла начиная со смещения из заголовка "
+        "Content-Range (bytes начало-конец/размер), без заголовка часть дописывается в конец. "
+        "Начало части должно совпадать с уже принятым размером файла, а длина тела и размер - "
+        "с заголовком Content-Range. Части одной загрузки принимаются по очереди",
+    ),
+    post=extend_schema(
+        summary="Завершение загрузки файла списка товаров",
+        description="Для отправки полностью принятого файла на загрузку списка товаров",
+    ),
+    delete=extend_schema(
+        summary="Отмена загрузки файла списка товаров",
+        description="Для удаления загрузки и принятой части файла",
+    ),
+)
+class PricelistUploadPartView(APIView):
+    """
+    Класс для передачи файла списка товаров по частям
+    """
+
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "pricelist_upload"
+
+    def get_upload(self, request, pk, lock=False):
+        uploads = PricelistUpload.objects.filter(
+            id=pk, shop__client=request.user.id, updated_at__gte=upload_expired_before()
+        )
+        if lock:
+            # повтор части, пока исходный запрос еще пишет файл, ждет его завершения
+            uploads = uploads.select_for_update()
+        return uploads.first()
+
+    def get(self, request, pk, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                upload = self.get_upload(request, pk)
+                if upload:
+                    return Response(
+                        {
+                            "Status": True,
+                            "Offset": upload.received,
+                            "Size": upload.size,
+                        },
+                        status=200,
+                    )
+                return Response(
+                    {"Status": False, "Error": "Загрузка не найдена"}, status=404
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+    def put(self, request, pk, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                with transaction.atomic():
+                    upload = self.get_upload(request, pk, lock=True)
+                    if upload:
+                        return self.write_part(request, upload)
+                return Response(
+                    {"Status": False, "Error": "Загрузка не найдена"}, status=404
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+    def write_part(self, request, upload):
+        """
+        Дописать часть файла со смещения из Content-Range. Вызывается
+        с заблокированной записью загрузки
+        """
+
+        offset, end = upload.received, None
+        limit = upload.size or settings.PRICELIST_UPLOAD_MAX_BYTES
+        if "Content-Range" in request.headers:
+            match = CONTENT_RANGE.match(request.headers["Content-Range"])
+            if not match or int(match[2]) < int(match[1]):
+                return Response(
+                    {"Status": False, "Error": "Неверный заголовок Content-Range"},
+                    status=400,
+                )
+            offset, end = int(match[1]), int(match[2]) + 1
+            if match[3] != "*" and int(match[3]) != (upload.size or int(match[3])):
+                return Response(
+                    {
+                        "Status": False,
+                        "Error": "Размер файла в Content-Range не совпадает с размером загрузки",
+                    },
+                    status=400,
+                )
+        if offset != upload.received:
+            return Response(
+                {
+                    "Status": False,
+                    "Error": "Начало части не совпадает с принятым размером файла, продолжите со смещения Offset",
+                    "Offset": upload.received,
+                },
+                status=409,
+            )
+        if (end or offset + int(request.headers.get("Content-Length") or 0)) > limit:
+            return Response(
+                {"Status": False, "Error": "Превышен размер файла"}, status=413
+            )
+        if request.stream:
+            received = write_upload(upload.id, offset, request.stream, limit)
+            if received > limit:
+                truncate_upload(upload.id, upload.received)
+                return Response(
+                    {"Status": False, "Error": "Превышен размер файла"}, status=413
+                )
+            if end is not None and received != end:
+                truncate_upload(upload.id, upload.received)
+                return Response(
+                    {
+                        "Status": False,
+                        "Error": "Размер части не совпадает с заголовком Content-Range",
+                        "Offset": upload.received,
+                    },
+                    status=400,
+                )
+            upload.received = received
+            upload.save(update_fields=["received", "updated_at"])
+        return Response({"Status": True, "Offset": upload.received}, status=200)
+
+    def post(self, request, pk, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                upload = self.get_upload(request, pk)
+                if upload:
+                    if upload.received and upload.received == (
+                        upload.size or upload.received
+                    ):
+                        blob_id = save_upload_part(upload.id, upload.format)
+                        upload.delete()
+                        return enqueue_pricelist(
+                            blob_id, upload.shop, request.user.email
+                        )
+                    return Response(
+                        {
+                            "Status": False,
+                            "Error": "Файл принят не полностью",
+                            "Offset": upload.received,
+                        },
+                        status=200,
+                    )
+                return Response(
+                    {"Status": False, "Error": "Загрузка не найдена"}, status=404
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+    def delete(self, request, pk, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                upload = self.get_upload(request, pk)
+                if upload:
+                    delete_upload(upload.id)
+                    upload.delete()
+                    return Response(
+                        {"Status": True, "Info": "Загрузка отменена"}, status=204
+                    )
+                return Response(
+                    {"Status": False, "Error": "Загрузка не найдена"}, status=404
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+
+@extend_schema(tags=["Профиль магазина"])
+@extend_schema_view(
+    get=extend_schema(
+        summary="Статус загрузки списка товаров",
+        description="Для отслеживания хода загрузки списка товаров по номеру задания из ответа на загрузку",
+    ),
+    post=extend_schema(
+        summary="Подтверждение задержанной загрузки",
+        description="Для публикации загрузки, задержанной из-за подозрительных изменений цен и количеств",
+    ),
+    delete=extend_schema(
+        summary="Отмена задержанной загрузки",
+        description="Для отмены загрузки, задержанной из-за подозрительных изменений цен и количеств",
+    ),
+)
+class ImportJobView(APIView):
+    """
+    Класс для отслеживания загрузок списка товаров профиля магазина
+    """
+
+    def get_held_job(self, request, pk):
+        return ImportJob.objects.filter(
+            id=pk, shop__client=request.user.id, state="held"
+        ).first()
+
+    def get(self, request, pk, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                job = ImportJob.objects.filter(
+                    id=pk, shop__client=request.user.id
+                ).first()
+                if job:
+                    return Response(ImportJobSerializer(job).data, status=200)
+                return Response(
+                    {"Status": False, "Error": "Загрузка не найдена"}, status=404
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+    def post(self, request, pk, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                job = self.get_held_job(request, pk)
+                if job:
+                    if ImportJob.objects.filter(id=job.id, state="held").update(
+                        state="queued", errors=[]
+                    ):
+                        celery_import_pricelist.apply_async(
+                            (None, job.id, request.user.email),
+                            task_id=job.task_id,
+                            queue=import_queue(job.lane),
+                        )
+                    return Response(
+                        {
+                            "Status": True,
+                            "Info": "Загрузка подтверждена и отправлена на публикацию",
+                            "Job": job.id,
+                        },
+                        status=202,
+                    )
+                return Response(
+                    {"Status": False, "Error": "Задержанная загрузка не найдена"},
+                    status=404,
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+    def delete(self, request, pk, *args, **kwargs):
+        if request.user.is_authenticated:
+            if request.user.type == "shop":
+                job = self.get_held_job(request, pk)
+                if job:
+                    if ImportJob.objects.filter(id=job.id, state="held").update(
+                        state="failed", finished_at=timezone.now()
+                    ):
+                        discard_import_plan(job.id)
+                    return Response(
+                        {"Status": True, "Info": "Загрузка отменена"}, status=204
+                    )
+                return Response(
+                    {"Status": False, "Error": "Задержанная загрузка не найдена"},
+                    status=404,
+                )
+            return Response(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+        return Response(
+            {"Status": False, "Error": "Вы не прошли аутентификацию"}, status=401
+        )
+
+
 @extend_schema(tags=["Товары"])
 @extend_schema_view(
     list=extend_schema(
         summary="Просмотр всех товаров",
-        description="Для просмотра всех товаров выставленных на сервисе",
+        description="Для просмотра всех товаров выставленных на сервисе. "
+        "Параметр search ищет по названию, модели, категории и параметрам товара, "
+        "результаты упорядочены по релевантности",
     ),
     retrieve=extend_schema(
         summary="Просмотр товара",
@@ -944,18 +1558,76 @@ class ProductsViewSet(ModelViewSet):
     Класс для работы с товарами выставленными на сервисе
     """
 
-    queryset = ProductInfo.objects.all()
+    queryset = ProductInfoSerializer.setup_eager_loading(
+        ProductInfo.objects.filter(is_active=True)
+    )
     serializer_class = ProductInfoSerializer
-    filter_backends = [SearchFilter]
+    filter_backends = [ProductFacetFilter, ProductSearchFilter]
+    cursor_orderings = {"id": ("id",), "price": ("price", "id")}
     search_fields = [
         "model",
         "product__name",
         "product_parameters__value",
         "product__category__name",
     ]
-    pagination_class = LimitOffsetPagination
+    pagination_class = OptionalCursorPagination
     http_method_names = ["get"]
 
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get("facets") == "true":
+            response.data["facets"] = facet_counts(request.query_params.get("category"))
+        return response
+
+
+@extend_schema(
+    tags=["Товары"],
+    summary="Подсказки по названиям товаров и категорий",
+    description="Для подсказок при вводе: лучшие совпадения по названиям продуктов "
+    "на продаже и категорий с оценкой похожести от 0 до 1, опечатки допускаются",
+    parameters=[
+        OpenApiParameter("q", str, description="Введенный текст", required=True),
+        OpenApiParameter(
+            "limit", int, description="Число подсказок каждого вида (по умолчанию 10)"
+        ),
+    ],
+)
+class ProductSuggestView(APIView):
+    """
+    Класс для подсказок по названиям товаров и категорий
+    """
+
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "suggest"
+
+    def get(self, request, *args, **kwargs):
+        text = request.query_params.get("q", "").strip()
+        limit = request.query_params.get("limit", str(settings.SUGGEST_LIMIT))
+        if not limit.isdigit() or not 0 < int(limit) <= settings.SUGGEST_MAX_LIMIT:
+            return Response(
+                {
+                    "Status": False,
+                    "Error": f"Неверный тип данных (целое число от 1 до {settings.SUGGEST_MAX_LIMIT})",
+                },
+                status=200,
+            )
+        if len(text) < settings.SUGGEST_MIN_LENGTH:
+            return Response({"products": [], "categories": []}, status=200)
+        products = suggest_names(
+            Product.objects.filter(
+                Exists(
+                    ProductInfo.objects.filter(product=OuterRef("pk"), is_active=True)
+                )
+            ),
+            text,
+            int(limit),
+            ("id", "name", "category"),
+        )
+        categories = suggest_names(Category.objects.all(), text, int(limit))
+        for row in [*products, *categories]:
+            row["similarity"] = round(row["similarity"], 3)
+        return Response({"products": products, "categories": categories}, status=200)
+
 
 @extend_schema(tags=["Товары"])
 @extend_schema_view(
@@ -976,7 +1648,7 @@ class CategoryView(ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     search_fields = ["name"]
-    pagination_class = LimitOffsetPagination
+    pagination_class = OptionalCursorPagination
     http_method_names = ["get"]
 
 
@@ -999,7 +1671,7 @@ class ShopView(ModelViewSet):
     queryset = Shop.objects.filter(state=True)
     serializer_class = ShopAllSerializer
     search_fields = ["name"]
-    pagination_class = LimitOffsetPagination
+    pagination_class = OptionalCursorPagination
     http_method_names = ["get"]
 
 
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework.authtoken",
     "rest_framework",
     "backend",
@@ -150,7 +151,12 @@ REST_FRAMEWORK = {
         "rest_framework.throttling.AnonRateThrottle",
         "rest_framework.throttling.UserRateThrottle",
     ],
-    "DEFAULT_THROTTLE_RATES": {"anon": "10/minute", "user": "40/minute"},
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "10/minute",
+        "user": "40/minute",
+        "pricelist_upload": "600/minute",
+        "suggest": "600/minute",
+    },
 }
 
 REDIS_PORT = os.getenv("REDIS_PORT")
@@ -160,6 +166,32 @@ CELERY_RESULT_BACKEND = "redis://" + REDIS_HOST + ":" + REDIS_PORT
 CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TASK_SERIALIZER = "json"
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "queue_order_strategy": "priority",
+    "priority_steps": list(range(10)),
+    "sep": ":",
+}
+
+PRICELIST_BATCH_SIZE = 1000
+PRICELIST_CHUNK_SIZE = 10000
+PRICELIST_SYNC_BATCH_SIZE = 5000
+PRICELIST_STREAM_BATCH_SIZE = 500
+PRICELIST_STREAM_FLUSH_MS = 200
+PRICELIST_IMPORT_LOCK_TIMEOUT = 60 * 60
+PRICELIST_IMPORT_RETRY_DELAY = 30
+PRICELIST_IMPORT_MAX_RETRIES = 5
+PRICELIST_FAST_LANE_BYTES = 256 * 1024
+PRICELIST_PRIORITY_STEPS = 10
+PRICELIST_UPLOAD_MAX_BYTES = 1024 * 1024 * 1024
+PRICELIST_UPLOAD_EXPIRE = 24 * 60 * 60
+PRICELIST_DIFF_SAMPLE_SIZE = 10
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+SUGGEST_MIN_LENGTH = 2
+PRICELIST_IMPORT_PROCESSES = 4
+PRICELIST_ANOMALY_PRICE_FACTOR = 10
+PRICELIST_ANOMALY_MIN_ITEMS = 20
+PRICELIST_BLOB_DIR = os.getenv("PRICELIST_BLOB_DIR", BASE_DIR / "pricelists")
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "API 'PET MARKETPLACE'",
@@ -18,9 +18,11 @@ from django.contrib import admin
 from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
-from backend.views import (BasketView, ConfirmEmail, LoginClient,
-                           OrderBuyerView, OrderShopView, ProfilContacts,
-                           ProfileClient, ProfileShop, ShopPricelist,
+from backend.views import (BasketView, ConfirmEmail, ImportJobView,
+                           LoginClient, OrderBuyerView, OrderShopView,
+                           PricelistUploadPartView, PricelistUploadView,
+                           ProfilContacts, ProfileClient, ProfileShop,
+                           ShopPricelist, ShopStock, ShopStockStream,
                            logout_view, reset_password_view, state_change_view)
 
 urlpatterns = [
@@ -38,6 +40,27 @@ urlpatterns = [
     path("shop/profile/", ProfileShop.as_view(), name="shop"),
     path("shop/profile/state/", state_change_view, name="state"),
     path("shop/profile/pricelist/", ShopPricelist.as_view(), name="pricelist"),
+    path("shop/profile/pricelist/stock/", ShopStock.as_view(), name="stock"),
+    path(
+        "shop/profile/pricelist/uploads/",
+        PricelistUploadView.as_view(),
+        name="pricelist_uploads",
+    ),
+    path(
+        "shop/profile/pricelist/uploads/<int:pk>/",
+        PricelistUploadPartView.as_view(),
+        name="pricelist_upload",
+    ),
+    path(
+        "shop/profile/pricelist/stock/stream/",
+        ShopStockStream.as_view(),
+        name="stock_stream",
+    ),
+    path(
+        "shop/profile/pricelist/<int:pk>/",
+        ImportJobView.as_view(),
+        name="pricelist_job",
+    ),
     path("shop/profile/orders/", OrderShopView.as_view(), name="orders"),
     path("products/", include("backend.urls")),
     path("products/", include("backend.urls")),